@@ -0,0 +1,322 @@
+# image_processor/backends.py
+# -- coding: utf-8 --
+"""
+可选的加速编解码后端。
+这些依赖都不是必需的：导入失败时对应的可用性检查返回 False，调用者回退到 Pillow 路径。
+"""
+
+import shutil
+import struct
+import subprocess
+import zlib
+
+import PIL
+from PIL import features as _pil_features
+
+# --- libjpeg-turbo (PyTurboJPEG) ---
+try:
+    from turbojpeg import TurboJPEG, TJPF_GRAY, TJSAMP_420, TJSAMP_GRAY, TJCS_GRAY, TJCS_YCbCr, TJCS_RGB
+    _turbo_jpeg = TurboJPEG()
+except Exception: # 未安装 PyTurboJPEG，或系统中找不到 libturbojpeg
+    _turbo_jpeg = None
+
+# --- mozjpeg (mozjpeg-lossless-optimization 包) ---
+try:
+    import mozjpeg_lossless_optimization as _mozjpeg
+except ImportError:
+    _mozjpeg = None
+
+# --- oxipng (pyoxipng 包) ---
+try:
+    import oxipng as _oxipng
+except ImportError:
+    _oxipng = None
+
+# --- libdeflate ---
+try:
+    import deflate as _libdeflate
+except ImportError:
+    _libdeflate = None
+
+# --- libwebp (webp 包，基于 cffi) ---
+try:
+    import webp as _webp
+except ImportError:
+    _webp = None
+
+# --- OpenCV (cv2 + numpy) ---
+try:
+    import cv2 as _cv2
+    import numpy as _np
+except ImportError:
+    _cv2 = None
+
+# --- jpegtran (libjpeg-turbo / mozjpeg 命令行工具) ---
+_jpegtran_path = shutil.which('jpegtran')
+
+# --- pngquant (有损调色板量化命令行工具) ---
+_pngquant_path = shutil.which('pngquant')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# JPEG 标准 (Annex K) 亮度量化表各项之和，libjpeg 按质量缩放的就是这张表
+_STD_LUMINANCE_QTABLE_SUM = sum((
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+))
+
+
+def pillow_simd_active():
+    """当前 PIL 是否为 Pillow-SIMD 构建 (其版本号带 .postN 后缀)"""
+    return '.post' in PIL.__version__
+
+
+def pillow_zlib_ng_active():
+    """Pillow 是否链接了 zlib-ng (PNG 的 DEFLATE 明显更快)；Pillow 较旧、不报告该特性时返回 False"""
+    return 'zlib_ng' in _pil_features.features and bool(_pil_features.check_feature('zlib_ng'))
+
+
+def turbojpeg_available():
+    """是否可以使用 libjpeg-turbo 直连路径"""
+    return _turbo_jpeg is not None
+
+
+def turbojpeg_recompress(jpeg_bytes, quality, scale_denominator=1, keep_metadata=True):
+    """
+    使用 libjpeg-turbo 解码并以指定质量重新编码 JPEG 字节，整个过程不经过 Pillow。
+    scale_denominator 大于 1 时在 IDCT 阶段直接以 1/N 分辨率解码 (与 Pillow 的 draft 相同)。
+    色度二次采样与 Pillow 默认行为一致 (4:2:0)，灰度图保持灰度；keep_metadata 为 True 时源文件的 EXIF/ICC 段原样复制到结果中。
+    返回新的 JPEG 字节；遇到不适合此路径的色彩空间 (如 CMYK/YCCK) 时返回 None。
+    """
+    _, _, _, colorspace = _turbo_jpeg.decode_header(jpeg_bytes)
+    scaling_factor = (1, scale_denominator) if scale_denominator > 1 else None
+    if colorspace == TJCS_GRAY:
+        pixels = _turbo_jpeg.decode(jpeg_bytes, pixel_format=TJPF_GRAY, scaling_factor=scaling_factor)
+        encoded = _turbo_jpeg.encode(pixels, quality=quality, pixel_format=TJPF_GRAY, jpeg_subsample=TJSAMP_GRAY)
+    elif colorspace in (TJCS_YCbCr, TJCS_RGB):
+        pixels = _turbo_jpeg.decode(jpeg_bytes, scaling_factor=scaling_factor) # 默认 BGR，encode 默认也按 BGR 解释
+        encoded = _turbo_jpeg.encode(pixels, quality=quality, jpeg_subsample=TJSAMP_420)
+    else:
+        return None
+    return splice_jpeg_metadata(jpeg_bytes, encoded) if keep_metadata else encoded
+
+
+def jpegtran_available():
+    """系统 PATH 中是否有 jpegtran"""
+    return _jpegtran_path is not None
+
+
+def jpegtran_optimize(jpeg_path):
+    """
+    用 jpegtran 无损优化 JPEG：重建最优哈夫曼表并改为渐进式扫描，不做色彩转换/IDCT/FDCT，画质不变。
+    保留全部元数据 (-copy all)。返回优化后的字节；jpegtran 失败时返回 None。
+    """
+    completed = subprocess.run([_jpegtran_path, '-copy', 'all', '-optimize', '-progressive', jpeg_path],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if completed.returncode != 0 or not completed.stdout:
+        return None
+    return completed.stdout
+
+
+def mozjpeg_available():
+    """是否可以使用 mozjpeg 对编码结果做无损优化"""
+    return _mozjpeg is not None
+
+
+def mozjpeg_optimize(jpeg_bytes):
+    """
+    用 mozjpeg 的 jpegtran 对 JPEG 字节做无损优化 (渐进式扫描 + 最优哈夫曼表)，DCT 系数不变，画质不变。
+    保留全部元数据段。返回优化后的字节；mozjpeg 无法处理输入或结果没有变小时返回 None。
+    """
+    try:
+        optimized = _mozjpeg.optimize(bytes(jpeg_bytes), copy=_mozjpeg.COPY_MARKERS.ALL)
+    except ValueError:
+        return None
+    if len(optimized) >= len(jpeg_bytes):
+        return None
+    return optimized
+
+
+def _jpeg_header_segments(jpeg_bytes):
+    """
+    遍历 JPEG 文件头 (SOI 到 SOS 之前) 的标记段，依次产出 (marker, 完整段字节)。
+    遇到格式异常时提前结束。
+    """
+    pos = 2 # 跳过 SOI
+    total = len(jpeg_bytes)
+    while pos + 4 <= total and jpeg_bytes[pos] == 0xFF:
+        marker = jpeg_bytes[pos + 1]
+        if marker == 0xDA: # SOS 之后是熵编码数据
+            return
+        length = struct.unpack('>H', jpeg_bytes[pos + 2:pos + 4])[0]
+        end = pos + 2 + length
+        if length < 2 or end > total:
+            return
+        yield marker, jpeg_bytes[pos:end]
+        pos = end
+
+
+def estimate_jpeg_quality(jpeg_path):
+    """
+    读取 JPEG 文件头中的 0 号 (亮度) 量化表，按 libjpeg 的质量缩放公式反推编码质量 (1-100)。
+    只逐段读取 SOS 之前的标记段，不解码图像；文件头异常或找不到该量化表时返回 None。
+    """
+    with open(jpeg_path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            head = f.read(4)
+            if len(head) < 4 or head[0] != 0xFF or head[1] == 0xDA:
+                return None
+            length = struct.unpack('>H', head[2:])[0]
+            if length < 2:
+                return None
+            if head[1] != 0xDB:
+                f.seek(length - 2, 1)
+                continue
+            data = f.read(length - 2)
+            pos = 0
+            while pos < len(data):
+                precision, table_id = data[pos] >> 4, data[pos] & 0x0F
+                size = 128 if precision else 64
+                values = data[pos + 1:pos + 1 + size]
+                if len(values) < size:
+                    return None
+                if table_id == 0:
+                    table_sum = sum(struct.unpack('>64H', values)) if precision else sum(values)
+                    scale = table_sum * 100 / _STD_LUMINANCE_QTABLE_SUM
+                    estimated = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+                    return max(1, min(100, round(estimated)))
+                pos += 1 + size
+
+
+def splice_jpeg_metadata(source_bytes, encoded_bytes):
+    """
+    把源 JPEG 中原样的 APP1 (EXIF/XMP) 与 APP2 (ICC) 段复制到新编码的 JPEG 中，
+    插在 SOI 及其 JFIF APP0 段之后，不经过 Pillow 的解析与重新序列化。
+    源文件没有这些段时直接返回 encoded_bytes。
+    """
+    metadata = [segment for marker, segment in _jpeg_header_segments(source_bytes) if marker in (0xE1, 0xE2)]
+    if not metadata:
+        return encoded_bytes
+    insert_at = 2
+    for marker, segment in _jpeg_header_segments(encoded_bytes):
+        if marker != 0xE0:
+            break
+        insert_at += len(segment)
+    return b''.join([encoded_bytes[:insert_at], *metadata, encoded_bytes[insert_at:]])
+
+
+def libwebp_available():
+    """是否可以直接调用 libwebp 编码"""
+    return _webp is not None
+
+
+def libwebp_encode(img, quality, lossless, method):
+    """
+    把 RGB/RGBA 模式的 Pillow 图像直接交给 libwebp 的 WebPEncode 编码，返回 WebP 字节。method 为 0-6 的速度/体积权衡。
+    编码调用期间释放 GIL；不写入 ICC/EXIF，需要保留元数据时调用者应走 Pillow。
+    """
+    picture = _webp.WebPPicture.from_pil(img)
+    webp_config = _webp.WebPConfig.new(quality=quality, lossless=lossless, method=method)
+    return bytes(picture.encode(webp_config).buffer())
+
+
+def opencv_available():
+    """是否可以使用 OpenCV 编码 PNG"""
+    return _cv2 is not None
+
+
+def opencv_encode_png(img, compression_level):
+    """
+    用 OpenCV (libpng) 把 RGB/RGBA/L 模式的 Pillow 图像编码为 PNG 字节，compression_level 为 0-9。
+    只写像素数据，不写 ICC/tRNS 等附加 chunk；编码失败时返回 None。
+    """
+    pixels = _np.asarray(img)
+    if img.mode == 'RGB':
+        pixels = _cv2.cvtColor(pixels, _cv2.COLOR_RGB2BGR)
+    elif img.mode == 'RGBA':
+        pixels = _cv2.cvtColor(pixels, _cv2.COLOR_RGBA2BGRA)
+    ok, encoded = _cv2.imencode('.png', pixels, [_cv2.IMWRITE_PNG_COMPRESSION, compression_level])
+    if not ok:
+        return None
+    return encoded.tobytes()
+
+
+def pngquant_available():
+    """系统 PATH 中是否有 pngquant"""
+    return _pngquant_path is not None
+
+
+def pngquant_quantize(png_path, quality_range, speed):
+    """
+    用 pngquant 把 PNG 有损量化为 256 色以内的调色板图像，quality_range 形如 '65-90'，speed 为 1 (最慢最好) 到 11。
+    结果经标准输出返回；达不到最低质量 (退出码 99)、结果不会更小 (退出码 98) 或其他失败时返回 None。
+    """
+    with open(png_path, 'rb') as src_file: # 输入文件为 '-' 时 pngquant 从标准输入读、向标准输出写
+        completed = subprocess.run([_pngquant_path, '--quality', quality_range, '--speed', str(speed), '--skip-if-larger', '-'],
+                                   stdin=src_file, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if completed.returncode != 0 or not completed.stdout:
+        return None
+    return completed.stdout
+
+
+def oxipng_available():
+    """是否可以使用 oxipng 无损优化 PNG"""
+    return _oxipng is not None
+
+
+def oxipng_optimize(png_bytes, level):
+    """
+    用 oxipng 无损优化内存中的 PNG 字节 (重新选择色彩类型/位深、滤波与 DEFLATE)，level 为 0-6 的优化预设。
+    去掉不影响显示的附加 chunk (StripChunks.safe)，保留 ICC/sRGB/gAMA 等色彩信息。
+    返回优化后的字节；oxipng 无法处理输入时返回 None。
+    """
+    try:
+        return _oxipng.optimize_from_memory(png_bytes, level=level, strip=_oxipng.StripChunks.safe())
+    except _oxipng.PngError:
+        return None
+
+
+def libdeflate_available():
+    """是否可以使用 libdeflate 重新压缩 PNG 数据流"""
+    return _libdeflate is not None
+
+
+def _png_chunk(chunk_type, data):
+    """组装一个完整的 PNG chunk (长度 + 类型 + 数据 + CRC)"""
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+
+def libdeflate_recompress_png(png_bytes, level):
+    """
+    保留 Pillow 已选好的扫描线滤波结果，仅用 libdeflate 重新压缩 IDAT 数据流。
+    所有 IDAT 合并为一个 chunk，其余 chunk 原样保留。
+    返回新的 PNG 字节；输入不是 PNG 或结果没有变小时返回 None。
+    """
+    if bytes(png_bytes[:len(PNG_SIGNATURE)]) != PNG_SIGNATURE: # 也接受 memoryview
+        return None
+    head_chunks, idat_parts, tail_chunks = [], [], []
+    pos = len(PNG_SIGNATURE)
+    total = len(png_bytes)
+    while pos + 8 <= total:
+        length, chunk_type = struct.unpack('>I4s', png_bytes[pos:pos + 8])
+        end = pos + 12 + length
+        if chunk_type == b'IDAT':
+            idat_parts.append(png_bytes[pos + 8:pos + 8 + length])
+        elif idat_parts:
+            tail_chunks.append(png_bytes[pos:end])
+        else:
+            head_chunks.append(png_bytes[pos:end])
+        pos = end
+    if not idat_parts:
+        return None
+
+    filtered_scanlines = zlib.decompress(b''.join(idat_parts))
+    new_idat = _libdeflate.zlib_compress(filtered_scanlines, level)
+    result = b''.join([PNG_SIGNATURE, *head_chunks, _png_chunk(b'IDAT', new_idat), *tail_chunks])
+    if len(result) >= total:
+        return None
+    return result
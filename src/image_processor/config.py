@@ -5,16 +5,79 @@ import os
 SUPPORTED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']
 RUN_STATE_DIR = 'run_state' # 相对于运行 main.py 的目录
 GLOBAL_LOG_FILE_PATH = os.path.join(RUN_STATE_DIR, 'compression.log')
+# 扫描时不进入的子目录名 (支持 fnmatch 通配符)，整个子树都会被跳过；设为空元组则扫描所有子目录
+SCAN_IGNORE_DIRS = ('.git', '.hg', '.svn', 'node_modules', '__pycache__')
+# 扫描目录时同时读取目录 (及图片文件 stat) 的线程数，在网络文件系统或冷缓存磁盘上能重叠 I/O 等待；设为 1 则逐个目录顺序扫描
+SCAN_THREADS = 8
 # 修改：建议的并发工作进程数 (0 表示使用 CPU 核心数 - 1，最少为 1)
 DEFAULT_WORKERS = 3 # 0 表示自动计算
+# 每次提交给工作进程的最大文件数 (任务较少时自动减小)，以及工作进程内处理一个批次时的流水线线程数
+TASK_BATCH_SIZE = 32
+BATCH_THREADS = 2
+# 批次失败 (例如工作进程崩溃) 时，整个运行中最多记录完整回溯的次数，之后只记录异常信息
+MAX_LOGGED_TRACEBACKS = 10
+# 开始处理一个批次时让内核预读批次内的所有文件，使磁盘/网络读取与编码重叠
+PREFETCH_FILES = True
+# 为 False 时工作进程不回传只写全局日志的 debug 消息 (减少序列化和主进程的格式化/写盘开销)；排查问题时设为 True
+WORKER_DEBUG_MESSAGES = False
+# 每个工作进程中 Pillow 保留以供复用的内存块数 (每块默认 16 MB)；0 表示不缓存
+PILLOW_BLOCKS_MAX = 8
+# 目录状态文件的写入缓冲：每个状态文件累积到该条数时追加写入一次 (目录处理完毕和程序退出时也会写入)
+STATE_FLUSH_EVERY = 50
+# 处理很慢的大图时条数迟迟不满：最早一条记录缓存超过该秒数后也写入，限制中途崩溃时需要重做的文件
+STATE_FLUSH_INTERVAL = 5.0
+# 目录日志 (_folder_*.log) 的写入缓冲：累积到该行数、或最早一行缓存超过该秒数时追加写入；ERROR/CRITICAL 立即写入
+DIR_LOG_FLUSH_EVERY = 64
+DIR_LOG_FLUSH_INTERVAL = 1.0
+# 写入目录日志的最低级别 ('DEBUG'/'INFO'/'WARNING'/'ERROR')；低于该级别的消息只写全局日志
+DIR_LOG_LEVEL = 'INFO'
+# 小于该大小 (KB) 的文件重新编码时不保留 EXIF/ICC (小图的元数据可能比像素数据还大)；0 表示始终保留
+# 注意：去掉 EXIF 也会去掉方向标记，带旋转信息的照片可能显示为未旋转
+PRESERVE_METADATA_MIN_SIZE_KB = 0
 
 # --- 原格式压缩模式特定配置 ---
 INPLACE_DIR_STATE_FILE_NAME = '.processed_files_original.log'
 INPLACE_DIR_LOG_FILE_NAME = '_folder_compression_original.log'
 INPLACE_DEFAULT_COMPRESSION_QUALITY = 85
 INPLACE_DEFAULT_PNG_OPTIMIZE = True
+# 启用 PNG 优化时 Pillow/OpenCV 使用的 zlib 压缩级别 (1-9)；与 optimize=True (固定为最慢的 9 级) 相比体积相近而 CPU 开销小得多
+INPLACE_PNG_COMPRESS_LEVEL = 6
+# 为 True 时恢复 Pillow 的 optimize=True (最小体积、最慢)
+INPLACE_PNG_FORCE_OPTIMIZE = False
 INPLACE_LARGE_FILE_THRESHOLD_MB = 15
 INPLACE_LARGE_FILE_COMPRESSION_QUALITY = 75
+# 大文件 JPEG 的解码缩放分母 (1/2/4/8)：大于 1 时用 libjpeg 的 DCT 缩放直接以 1/N 分辨率解码，输出分辨率随之降低；1 表示保持原分辨率。
+# 其他值按 libjpeg 支持的比例向下取整 (如 3 按 2 处理)
+INPLACE_LARGE_FILE_DRAFT_SCALE = 1
+# 若安装了 mozjpeg-lossless-optimization，大文件 JPEG 降质编码后再用 mozjpeg 无损优化一遍 (渐进式 + 最优哈夫曼表)
+INPLACE_USE_MOZJPEG = True
+# 带透明度的图像保存为 JPEG 时，透明区域合成到的背景色 (RGB)
+INPLACE_FLATTEN_BACKGROUND = (255, 255, 255)
+# 若安装了 PyTurboJPEG，RGB/灰度 JPEG 直接交给 libjpeg-turbo 重新编码 (绕过 Pillow)，EXIF/ICC 段原样保留
+INPLACE_USE_TURBOJPEG = True
+# 为 True 时，未触发大文件降质的 JPEG 只做无损优化 (mozjpeg 或 PATH 中的 jpegtran；不按所选质量重新编码，画质不变)；
+# 没有可用的无损工具时保留原图
+INPLACE_JPEG_LOSSLESS_OPTIMIZE = False
+# 小于该大小 (MB) 的 JPEG 不启动 jpegtran 子进程 (进程启动开销超过收益)，只做无损优化时保留原图；mozjpeg 在进程内运行，不受此限制
+INPLACE_JPEGTRAN_MIN_MB = 0.2
+# 从量化表估算的 JPEG 质量不超过目标质量加该余量时，不再重新编码，只做无损优化 (没有 jpegtran/mozjpeg 时保留原图)；None 表示总是重新编码
+INPLACE_JPEG_QUALITY_MARGIN = 2
+# 若安装了 pyoxipng，启用 PNG 优化时原文件直接交给 oxipng 以该预设 (0-6) 无损优化，不经过 Pillow；失败时走下面的路径
+INPLACE_USE_OXIPNG = True
+INPLACE_OXIPNG_LEVEL = 2
+# 若安装了 libdeflate 绑定 (deflate 包)，启用 PNG 优化时由 libdeflate 以该级别 (1-12) 重新压缩 IDAT 数据
+INPLACE_USE_LIBDEFLATE = True
+INPLACE_LIBDEFLATE_LEVEL = 12
+# 未使用 libdeflate 时，若安装了 opencv-python (cv2)，RGB/RGBA/灰度 PNG 交给 OpenCV 的 libpng 编码 (级别同 Pillow 路径)
+INPLACE_USE_OPENCV_PNG = True
+# 为 True 且 PATH 中有 pngquant 时，PNG 改为有损的调色板量化 (通常比无损优化小得多，但会改变像素)；量化达不到质量范围时回退到无损路径
+INPLACE_PNG_ALLOW_LOSSY = False
+INPLACE_PNGQUANT_QUALITY = '65-90'
+INPLACE_PNGQUANT_SPEED = 3 # 1 最慢、体积最小；pngquant 默认为 4
+# 压缩结果不小于原始大小的该比例时保留原图，不写回 (1.0 表示只要不变大就写回)
+INPLACE_MIN_SAVINGS_RATIO = 0.95
+# 小于该大小 (MB) 的 JPEG 已经过量化，再压缩几乎没有收益，直接跳过解码 (0 表示不跳过)
+INPLACE_SKIP_SMALL_JPEG_MB = 0.05
 
 
 # --- WebP 模式特定配置 ---
@@ -22,6 +85,13 @@ WEBP_DIR_STATE_FILE_NAME = '.processed_files_webp.log'
 WEBP_DIR_LOG_FILE_NAME = '_folder_webp.log'
 WEBP_DEFAULT_QUALITY = 85
 WEBP_DEFAULT_LOSSLESS = False # False 表示默认有损，但PNG/BMP/TIFF会倾向无损
+# libwebp 的速度/体积权衡 (0 最快，6 最慢、体积最小)，有损与无损编码分别设置；无损编码对该值最敏感
+WEBP_METHOD = 4
+WEBP_LOSSLESS_METHOD = 4
+# 像素数超过该值的大图，上面的 method 各降低 1 级，限制单张图片的编码耗时；0 表示不调整
+WEBP_LARGE_IMAGE_PIXELS = 8_000_000
+# 若安装了 webp 包 (libwebp 的 cffi 绑定)，不含 EXIF/ICC 的图像直接交给 libwebp 编码 (绕过 Pillow 的保存流程)
+WEBP_USE_LIBWEBP = True
 
 # --- 多语言文本 ---
 texts = {
@@ -50,9 +120,12 @@ texts = {
         "user_interrupt": "用户中断输入。",
         # 新增: 工作进程计算日志
         "calculating_workers": "正在计算建议的工作进程数...",
-        "detected_cores": "检测到 {cpu_cores} 个 CPU 核心。",
+        "detected_cores": "检测到当前进程可用的 {cpu_cores} 个 CPU 核心。",
         "suggested_workers": "建议使用 {workers} 个工作进程。",
         "using_workers": "将使用 {workers} 个工作进程。",
+        "codec_backends": "编解码库: Pillow {pillow} (SIMD 构建: {simd}，zlib-ng: {zlib_ng})，libjpeg-turbo: {turbojpeg}，libdeflate: {libdeflate}，libwebp: {libwebp}，jpegtran: {jpegtran}，mozjpeg: {mozjpeg}，oxipng: {oxipng}，pngquant: {pngquant}",
+        "backend_yes": "可用",
+        "backend_no": "不可用",
         "error_cpu_count": "无法检测 CPU 核心数，将使用默认值 {fallback}。",
         "error_cpu_count_unsupported": "CPU 核心数检测不受支持，将使用默认值 {fallback}。",
         "task_start": "="*30 + " 开始执行图片处理任务 (模式: {mode_name}) " + "="*30,
@@ -96,23 +169,21 @@ texts = {
         "log_load_state_success": "成功从 {path} 加载 {count} 条记录",
         "log_load_state_fail": "加载目录状态文件 {path} 时出错: {error}",
         "log_save_state_fail": "追加记录到目录状态文件 {path} 时出错 (原始文件名: {filename}): {error}",
+        "log_flush_state_fail": "写入 {count} 条记录到目录状态文件 {path} 时出错: {error}",
         # 新增: Manager 相关日志
-        "manager_start_success": "多进程管理器已启动。",
-        "manager_start_fail": "错误：无法启动多进程管理器: {error}",
         # 新增: 任务收集相关日志
         "task_collect_scan": "正在扫描目录并收集任务...",
         "task_collect_error": "错误：在扫描目录和收集任务时出错: {error}",
         "task_collect_success": "已收集 {count} 个任务，分布在 {dirs} 个目录中。",
         "no_tasks_found": "在指定目录及其子目录中未找到需要处理的图片文件。",
         "task_collect_skip_not_file": "路径在任务收集中不是有效文件：{path}。正在跳过。",
+        "convert_target_conflict": "目标文件 {webp_filename} 已存在，或同目录中的其他图片也会转换为该文件名；为避免丢失图片，不转换：{path}",
         # 新增: 任务执行相关日志
         "submitting_tasks": "正在将 {count} 个任务提交到进程池...",
         "tasks_submitted": "所有任务已提交，等待结果...",
         "progress_update": "进度: {done}/{total} 个任务已完成。",
-        "task_timeout": "任务处理超时 ({timeout} 秒): {path}",
         "task_result_error": "获取任务结果时出错 ({path}): {error}",
         "task_failed": "处理文件失败: {path}: {details}",
-        "manager_shutdown_error": "关闭管理器时出错: {error}",
         "finished_processing_loop": "处理循环结束。已处理 {done}/{total} 个任务。",
         # 新增: 体积计算相关日志
         "size_reduction_error_zero": "计算体积减少百分比时发生除零错误。",
@@ -134,20 +205,38 @@ texts = {
         "compress_format_identified": "识别到图片格式: {format} for {path}",
         "compress_large_file": "检测到大文件 (> {threshold} MB)，应用特殊压缩质量: {quality}",
         "compress_large_file_log": "{filename} - 检测到大文件 (> {threshold} MB)，应用特殊压缩质量: {quality}",
+        "compress_large_file_draft": "以缩小的分辨率解码大文件 JPEG: {orig_w}x{orig_h} -> {w}x{h}: {path}",
+        "compress_large_file_draft_log": "{filename} - 以缩小的分辨率解码: {orig_w}x{orig_h} -> {w}x{h}",
         "compress_rgba_to_rgb": "图片 {path} 是 RGBA 模式，将转换为 RGB 后保存为 JPEG。",
         "compress_rgba_to_rgb_log": "图片 {filename} 是 RGBA 模式，将转换为 RGB。",
         "compress_default_save": "使用默认设置按原格式 {format} 保存: {path}",
+        "compress_turbojpeg": "使用 libjpeg-turbo 直连路径重新编码 JPEG (quality={quality}): {path}",
+        "compress_turbojpeg_fallback": "libjpeg-turbo 直连路径不可用于 {path} ({reason})，回退到 Pillow",
+        "compress_jpegtran": "已无损优化 JPEG (不重新编码): {path}",
+        "compress_lossless_kept_path": "只做无损优化：没有可用的无损优化工具或优化没有收益，保留原图: {path}",
+        "compress_lossless_kept": "{filename} 只做无损优化：没有可用的无损优化工具或优化没有收益，保留原图。",
+        "compress_low_quality_jpeg_path": "JPEG 估计质量 {estimated} 不高于目标质量 {quality}，不重新编码: {path}",
+        "compress_low_quality_jpeg": "JPEG 估计质量 {estimated} 不高于目标质量 {quality}，不重新编码: {filename}",
+        "compress_pngquant": "已使用 pngquant 有损量化 PNG (质量 {quality}): {path}",
+        "compress_pngquant_fallback": "pngquant 未能在质量范围内量化 {path}，回退到无损压缩",
+        "compress_oxipng": "已使用 oxipng (level={level}) 无损优化 PNG: {path}",
+        "compress_oxipng_fallback": "oxipng 无法处理 {path}，回退到重新编码",
+        "compress_libdeflate": "已使用 libdeflate (level={level}) 重新压缩 PNG 数据流: {path}",
+        "compress_mozjpeg": "已使用 mozjpeg 无损优化大文件 JPEG ({before} -> {after} 字节): {path}",
+        "compress_opencv": "使用 OpenCV 编码 PNG (压缩级别 {level}): {path}",
+        "compress_opencv_fallback": "OpenCV 不适用于 {path} (模式 {mode} 或含透明色/ICC)，使用 Pillow",
         "compress_save_temp_success": "图片成功压缩/保存到临时文件: {path}",
         "compress_temp_invalid": "压缩/保存结果无效（临时文件不存在或为空），原图 {filename} 不会被删除。",
         "compress_temp_invalid_path": "压缩/保存结果无效: {path}，原图 {original_path} 不会被删除。",
         "compress_temp_clean_fail": "清理无效临时文件 {path} 时失败: {error}",
-        "compress_remove_original_success": "成功删除原图: {path}",
-        "compress_remove_original_fail": "删除原图 {filename} 时失败: {error}。压缩/保存后的文件 {temp_filename} 将被保留。",
-        "compress_remove_original_fail_path": "删除原图 {path} 时失败: {error}。临时文件 {temp_path} 被保留。",
         "compress_rename_success": "原格式压缩成功: {filename} (原: {orig_mb:.2f} MB, 现: {comp_mb:.2f} MB, 减少: {percent:.1f}%)",
         "compress_rename_success_path": "原格式压缩成功并替换: {path} (原: {orig_mb:.2f} MB, 现: {comp_mb:.2f} MB)",
-        "compress_rename_fail": "重命名临时文件 {temp_filename} 到 {filename} 时失败: {error}。原图已被删除！请手动处理 {temp_filename}！",
-        "compress_rename_fail_path": "重命名临时文件 {temp_path} 到 {path} 时失败: {error}。原图已被删除！请手动处理！",
+        "compress_replace_fail": "用压缩结果替换原图 {filename} 时失败: {error}。原图保持不变。",
+        "compress_replace_fail_path": "用临时文件 {temp_path} 替换 {path} 时失败: {error}。原图保持不变。",
+        "compress_small_jpeg_kept_path": "JPEG 小于 {threshold} MB，跳过重新压缩，保留原文件: {path}",
+        "compress_small_jpeg_kept": "{filename} 小于 {threshold} MB，跳过重新压缩，保留原文件。",
+        "compress_no_gain_kept_path": "压缩收益不足 ({orig} -> {comp} 字节)，保留原图: {path}",
+        "compress_no_gain_kept": "{filename} 压缩收益不足 ({orig} -> {comp} 字节)，保留原图。",
         "compress_unidentified": "无法识别的图片文件或文件已损坏: {filename}，跳过处理。",
         "compress_unidentified_path": "无法识别的图片文件或文件已损坏: {path}，跳过处理。",
         "compress_unidentified_clean_fail": "清理损坏图片产生的临时文件 {path} 失败。",
@@ -164,36 +253,35 @@ texts = {
         "convert_get_size_fail": "无法获取文件大小 {filename}: {error}",
         "convert_get_size_fail_path": "无法获取文件大小 {path}: {error}",
         "convert_open_success": "成功打开图片: {path}",
-        "convert_webp_options": "WebP 保存选项: quality={quality}, mode={mode} for {path}",
+        "convert_webp_options": "WebP 保存选项: quality={quality}, mode={mode}, method={method} for {path}",
         "convert_webp_options_log": "{filename} -> {webp_filename}: WebP 选项 quality={quality}, mode={mode}",
+        "convert_libwebp": "直接调用 libwebp 编码: {path}",
+        "convert_libwebp_fallback": "libwebp 直连路径不可用于 {path} ({reason})，回退到 Pillow",
+        "core_convert_mode": "正在将 {mode} 模式图像 {path} 转换为 {target} 以便保存为 WebP",
+        "core_strip_metadata": "文件小于 {threshold} KB，重新编码时不保留 EXIF/ICC: {path}",
+        "core_convert_mode_fail": "无法将 {mode} 模式图像 {path} 转换为 {target} 以便保存为 WebP: {error}",
         "convert_lossless": "无损(Lossless)",
         "convert_lossy": "有损(Lossy)",
         # 新增: WebP 转换相关日志
-        "core_convert_p_to_rgba": "正在将 P 模式图像 {path} 转换为 RGBA 以便保存为 WebP",
-        "core_convert_p_to_rgb": "正在将 P 模式图像 {path} 转换为 RGB 以便保存为 WebP",
-        "core_convert_p_fail": "无法转换 P 模式图像 {path} 以便保存为 WebP: {error}",
-        "core_convert_la_to_rgba": "正在将 LA 模式图像 {path} 转换为 RGBA 以便保存为 WebP",
-        "core_convert_other_to_rgb": "正在将 {mode} 模式图像 {path} 转换为 RGB 以便保存为 WebP",
-        "core_convert_other_fail": "无法将 {mode} 模式图像 {path} 转换为 RGB 以便保存为 WebP: {error}",
-        "core_overwrite_webp_warn": "目标 WebP 文件已存在，将尝试覆盖: {path}",
-        "core_overwrite_webp_fail": "无法删除已存在的目标 WebP 文件: {path}: {error}",
         "convert_save_temp_success": "图片成功转换为 WebP 并保存到临时文件: {path}",
         "convert_temp_invalid": "WebP 转换结果无效（临时文件不存在或为空），原图 {filename} 不会被删除。",
         "convert_temp_invalid_path": "WebP 转换结果无效: {path}，原图 {original_path} 不会被删除。",
         "convert_temp_clean_fail": "清理无效临时文件 {path} 时失败: {error}",
         "convert_remove_original_success": "成功删除原图: {path}",
-        "convert_remove_original_fail": "删除原图 {filename} 时失败: {error}。转换后的 WebP 文件 {temp_filename} 将被保留。",
-        "convert_remove_original_fail_path": "删除原图 {path} 时失败: {error}。临时文件 {temp_path} 被保留。",
+        "convert_remove_original_fail": "删除原图 {filename} 时失败: {error}。转换后的 WebP 文件 {webp_filename} 已就位，原图需手动删除。",
+        "convert_remove_original_fail_path": "删除原图 {path} 时失败: {error}。WebP 文件 {webp_path} 已就位。",
+        "convert_replace_fail": "把转换结果写入 {webp_filename} 时失败: {error}。原图 {filename} 保持不变。",
+        "convert_replace_fail_path": "用临时 WebP 文件 {temp_path} 替换 {webp_path} 时失败: {error}。原图保持不变。",
         "convert_rename_success": "成功转换为 WebP 并替换: {filename} -> {webp_filename} (原: {orig_mb:.2f} MB, 现: {webp_mb:.2f} MB, 减少: {percent:.1f}%)",
         "convert_rename_success_path": "成功转换为 WebP 并替换: {path} -> {webp_path} (原: {orig_mb:.2f} MB, 现: {webp_mb:.2f} MB)",
-        "convert_rename_fail": "重命名临时 WebP 文件 {temp_filename} 到 {webp_filename} 时失败: {error}。原图已被删除！请手动处理 {temp_filename}！",
-        "convert_rename_fail_path": "重命名临时 WebP 文件 {temp_path} 到 {webp_path} 时失败: {error}。原图已被删除！请手动处理！",
         "convert_unidentified": "无法识别的图片文件或文件已损坏: {filename}，跳过转换。",
         "convert_unidentified_path": "无法识别的图片文件或文件已损坏: {path}，跳过转换。",
         "convert_unidentified_clean_fail": "清理损坏图片产生的临时文件 {path} 失败。",
         "convert_io_error": "处理文件 {filename} 或写入 WebP 时发生 IO/OS 错误: {error}",
         "convert_io_error_path": "处理文件 {path} 或写入 WebP 时发生 IO/OS 错误: {error}",
         "convert_value_error": "保存 WebP 文件 {webp_filename} 时出错 (可能是不支持的模式或选项): {error}",
+        "convert_too_large": "{filename} 尺寸 {width}x{height} 超出 WebP 上限 {max} 像素，跳过转换，原图保持不变。",
+        "convert_too_large_path": "图像尺寸 {width}x{height} 超出 WebP 上限 {max} 像素: {path}",
         "convert_value_error_path": "保存 WebP 文件 {webp_path} 时出错: {error}",
         "convert_value_error_clean_fail": "清理 WebP 保存失败产生的临时文件 {path} 失败。",
         "convert_unexpected_error": "转换文件 {filename} 到 WebP 时发生未预料的严重错误: {error}\n{traceback}",
@@ -230,9 +318,12 @@ texts = {
         "user_interrupt": "User interrupted input.",
         # Added: Worker calculation logs
         "calculating_workers": "Calculating suggested number of workers...",
-        "detected_cores": "Detected {cpu_cores} CPU cores.",
+        "detected_cores": "Detected {cpu_cores} CPU cores available to this process.",
         "suggested_workers": "Suggesting {workers} worker processes.",
         "using_workers": "Using {workers} worker processes.",
+        "codec_backends": "Codec backends: Pillow {pillow} (SIMD build: {simd}, zlib-ng: {zlib_ng}), libjpeg-turbo: {turbojpeg}, libdeflate: {libdeflate}, libwebp: {libwebp}, jpegtran: {jpegtran}, mozjpeg: {mozjpeg}, oxipng: {oxipng}, pngquant: {pngquant}",
+        "backend_yes": "available",
+        "backend_no": "not available",
         "error_cpu_count": "Could not detect CPU cores, using fallback {fallback}.",
         "error_cpu_count_unsupported": "CPU core detection not supported, using fallback {fallback}.",
         "task_start": "="*30 + " Starting Image Processing Task (Mode: {mode_name}) " + "="*30,
@@ -276,23 +367,21 @@ texts = {
         "log_load_state_success": "Successfully loaded {count} records from {path}",
         "log_load_state_fail": "Error loading directory state file {path}: {error}",
         "log_save_state_fail": "Error appending record to directory state file {path} (Original filename: {filename}): {error}",
+        "log_flush_state_fail": "Error writing {count} records to directory state file {path}: {error}",
         # Added: Manager related logs
-        "manager_start_success": "Multiprocessing manager started.",
-        "manager_start_fail": "Error: Failed to start multiprocessing manager: {error}",
         # Added: Task collection related logs
         "task_collect_scan": "Scanning directories and collecting tasks...",
         "task_collect_error": "Error: Error during directory scan and task collection: {error}",
         "task_collect_success": "Collected {count} tasks to process across {dirs} directories.",
         "no_tasks_found": "No image files found to process in the specified directory and its subdirectories.",
         "task_collect_skip_not_file": "Path is not a valid file during task collection: {path}. Skipping.",
+        "convert_target_conflict": "Target file {webp_filename} already exists, or another image in the same directory would also be converted to that name; not converting, to avoid losing images: {path}",
         # Added: Task execution related logs
         "submitting_tasks": "Submitting {count} tasks to the process pool...",
         "tasks_submitted": "All tasks submitted. Waiting for results...",
         "progress_update": "Progress: {done}/{total} tasks completed.",
-        "task_timeout": "Task timed out ({timeout} seconds): {path}",
         "task_result_error": "Error retrieving result for task ({path}): {error}",
         "task_failed": "Failed to process file: {path}: {details}",
-        "manager_shutdown_error": "Error shutting down manager: {error}",
         "finished_processing_loop": "Finished processing loop. Handled {done}/{total} tasks.",
         # Added: Size calculation related logs
         "size_reduction_error_zero": "Division by zero error during reduction calculation.",
@@ -314,20 +403,38 @@ texts = {
         "compress_format_identified": "Identified image format: {format} for {path}",
         "compress_large_file": "Detected large file (> {threshold} MB), applying special compression quality: {quality}",
         "compress_large_file_log": "{filename} - Detected large file (> {threshold} MB), applying special compression quality: {quality}",
+        "compress_large_file_draft": "Decoding large JPEG at reduced resolution: {orig_w}x{orig_h} -> {w}x{h}: {path}",
+        "compress_large_file_draft_log": "{filename} - decoding at reduced resolution: {orig_w}x{orig_h} -> {w}x{h}",
         "compress_rgba_to_rgb": "Image {path} is RGBA mode, converting to RGB before saving as JPEG.",
         "compress_rgba_to_rgb_log": "Image {filename} is RGBA mode, converting to RGB.",
         "compress_default_save": "Saving with default settings in original format {format}: {path}",
+        "compress_turbojpeg": "Re-encoding JPEG via the direct libjpeg-turbo path (quality={quality}): {path}",
+        "compress_turbojpeg_fallback": "Direct libjpeg-turbo path not usable for {path} ({reason}), falling back to Pillow",
+        "compress_jpegtran": "Losslessly optimized JPEG (no re-encode): {path}",
+        "compress_lossless_kept_path": "Lossless optimization only: no lossless tool applies or it gave no gain, keeping the original: {path}",
+        "compress_lossless_kept": "{filename}: lossless optimization only: no lossless tool applies or it gave no gain, keeping the original.",
+        "compress_low_quality_jpeg_path": "Estimated JPEG quality {estimated} is not above target {quality}, not re-encoding: {path}",
+        "compress_low_quality_jpeg": "Estimated JPEG quality {estimated} is not above target {quality}, not re-encoding: {filename}",
+        "compress_pngquant": "Quantized PNG with pngquant (quality {quality}): {path}",
+        "compress_pngquant_fallback": "pngquant could not quantize {path} within the quality range, falling back to lossless compression",
+        "compress_oxipng": "Losslessly optimized PNG with oxipng (level={level}): {path}",
+        "compress_oxipng_fallback": "oxipng could not process {path}, falling back to re-encoding",
+        "compress_libdeflate": "Re-compressed PNG data stream with libdeflate (level={level}): {path}",
+        "compress_mozjpeg": "Losslessly optimized large JPEG with mozjpeg ({before} -> {after} bytes): {path}",
+        "compress_opencv": "Encoding PNG with OpenCV (compression level {level}): {path}",
+        "compress_opencv_fallback": "OpenCV not usable for {path} (mode {mode}, or transparency/ICC present), using Pillow",
         "compress_save_temp_success": "Image successfully compressed/saved to temporary file: {path}",
         "compress_temp_invalid": "Compression/save result invalid (temp file missing or empty), original file {filename} will not be deleted.",
         "compress_temp_invalid_path": "Compression/save result invalid: {path}, original file {original_path} will not be deleted.",
         "compress_temp_clean_fail": "Failed to clean up invalid temporary file {path}: {error}",
-        "compress_remove_original_success": "Successfully deleted original image: {path}",
-        "compress_remove_original_fail": "Failed to delete original image {filename}: {error}. Compressed/saved file {temp_filename} will be kept.",
-        "compress_remove_original_fail_path": "Failed to delete original image {path}: {error}. Temporary file {temp_path} is kept.",
         "compress_rename_success": "Original format compression successful: {filename} (Orig: {orig_mb:.2f} MB, New: {comp_mb:.2f} MB, Reduced: {percent:.1f}%)",
         "compress_rename_success_path": "Original format compression successful and replaced: {path} (Orig: {orig_mb:.2f} MB, New: {comp_mb:.2f} MB)",
-        "compress_rename_fail": "Failed to rename temporary file {temp_filename} to {filename}: {error}. Original file deleted! Please manually handle {temp_filename}!",
-        "compress_rename_fail_path": "Failed to rename temporary file {temp_path} to {path}: {error}. Original file deleted! Please manually handle!",
+        "compress_replace_fail": "Failed to replace original image {filename} with the compressed result: {error}. The original is unchanged.",
+        "compress_replace_fail_path": "Failed to replace {path} with temporary file {temp_path}: {error}. The original is unchanged.",
+        "compress_small_jpeg_kept_path": "JPEG is smaller than {threshold} MB, skipping recompression and keeping the original: {path}",
+        "compress_small_jpeg_kept": "{filename} is smaller than {threshold} MB, skipping recompression and keeping the original.",
+        "compress_no_gain_kept_path": "Compression gain too small ({orig} -> {comp} bytes), keeping the original: {path}",
+        "compress_no_gain_kept": "{filename}: compression gain too small ({orig} -> {comp} bytes), keeping the original.",
         "compress_unidentified": "Unidentified image file or file corrupted: {filename}, skipping processing.",
         "compress_unidentified_path": "Unidentified image file or file corrupted: {path}, skipping processing.",
         "compress_unidentified_clean_fail": "Failed to clean up temporary file {path} from corrupted image.",
@@ -344,36 +451,35 @@ texts = {
         "convert_get_size_fail": "Cannot get file size for {filename}: {error}",
         "convert_get_size_fail_path": "Cannot get file size for {path}: {error}",
         "convert_open_success": "Successfully opened image: {path}",
-        "convert_webp_options": "WebP save options: quality={quality}, mode={mode} for {path}",
+        "convert_webp_options": "WebP save options: quality={quality}, mode={mode}, method={method} for {path}",
         "convert_webp_options_log": "{filename} -> {webp_filename}: WebP options quality={quality}, mode={mode}",
+        "convert_libwebp": "Encoding directly with libwebp: {path}",
+        "convert_libwebp_fallback": "Direct libwebp path not usable for {path} ({reason}), falling back to Pillow",
+        "core_convert_mode": "Converting {mode} mode image {path} to {target} for WebP save",
+        "core_strip_metadata": "File is smaller than {threshold} KB, EXIF/ICC not kept when re-encoding: {path}",
+        "core_convert_mode_fail": "Failed to convert {mode} mode image {path} to {target} for WebP save: {error}",
         "convert_lossless": "Lossless",
         "convert_lossy": "Lossy",
          # Added: WebP conversion related logs
-        "core_convert_p_to_rgba": "Converting P mode image {path} to RGBA for WebP save",
-        "core_convert_p_to_rgb": "Converting P mode image {path} to RGB for WebP save",
-        "core_convert_p_fail": "Could not convert P mode image {path} for WebP save: {error}",
-        "core_convert_la_to_rgba": "Converting LA mode image {path} to RGBA for WebP save",
-        "core_convert_other_to_rgb": "Converting {mode} mode image {path} to RGB for WebP save",
-        "core_convert_other_fail": "Could not convert {mode} mode image {path} to RGB for WebP save: {error}",
-        "core_overwrite_webp_warn": "Target WebP file exists, attempting overwrite: {path}",
-        "core_overwrite_webp_fail": "Failed to remove existing target WebP: {path}: {error}",
         "convert_save_temp_success": "Image successfully converted to WebP and saved to temporary file: {path}",
         "convert_temp_invalid": "WebP conversion result invalid (temp file missing or empty), original file {filename} will not be deleted.",
         "convert_temp_invalid_path": "WebP conversion result invalid: {path}, original file {original_path} will not be deleted.",
         "convert_temp_clean_fail": "Failed to clean up invalid temporary file {path}: {error}",
         "convert_remove_original_success": "Successfully deleted original image: {path}",
-        "convert_remove_original_fail": "Failed to delete original image {filename}: {error}. Converted WebP file {temp_filename} will be kept.",
-        "convert_remove_original_fail_path": "Failed to delete original image {path}: {error}. Temporary file {temp_path} is kept.",
+        "convert_remove_original_fail": "Failed to delete original image {filename}: {error}. Converted WebP file {webp_filename} is in place; please delete the original manually.",
+        "convert_remove_original_fail_path": "Failed to delete original image {path}: {error}. WebP file {webp_path} is in place.",
+        "convert_replace_fail": "Failed to write the converted result to {webp_filename}: {error}. Original image {filename} is unchanged.",
+        "convert_replace_fail_path": "Failed to move temporary WebP file {temp_path} to {webp_path}: {error}. The original is unchanged.",
         "convert_rename_success": "Successfully converted to WebP and replaced: {filename} -> {webp_filename} (Orig: {orig_mb:.2f} MB, New: {webp_mb:.2f} MB, Reduced: {percent:.1f}%)",
         "convert_rename_success_path": "Successfully converted to WebP and replaced: {path} -> {webp_path} (Orig: {orig_mb:.2f} MB, New: {webp_mb:.2f} MB)",
-        "convert_rename_fail": "Failed to rename temporary WebP file {temp_filename} to {webp_filename}: {error}. Original file deleted! Please manually handle {temp_filename}!",
-        "convert_rename_fail_path": "Failed to rename temporary WebP file {temp_path} to {webp_path}: {error}. Original file deleted! Please manually handle!",
         "convert_unidentified": "Unidentified image file or file corrupted: {filename}, skipping conversion.",
         "convert_unidentified_path": "Unidentified image file or file corrupted: {path}, skipping conversion.",
         "convert_unidentified_clean_fail": "Failed to clean up temporary file {path} from corrupted image.",
         "convert_io_error": "IO/OS error occurred while processing file {filename} or writing WebP: {error}",
         "convert_io_error_path": "IO/OS error occurred while processing file {path} or writing WebP: {error}",
         "convert_value_error": "Error saving WebP file {webp_filename} (possibly unsupported mode or options): {error}",
+        "convert_too_large": "{filename} is {width}x{height}, beyond the WebP limit of {max} pixels; skipping conversion, original unchanged.",
+        "convert_too_large_path": "Image size {width}x{height} exceeds the WebP limit of {max} pixels: {path}",
         "convert_value_error_path": "Error saving WebP file {webp_path}: {error}",
         "convert_value_error_clean_fail": "Failed to clean up temporary file {path} from WebP save failure.",
         "convert_unexpected_error": "Unexpected critical error converting file {filename} to WebP: {error}\n{traceback}",
@@ -1,39 +1,137 @@
 # image_processor/core.py
 # -- coding: utf-8 --
 
+import io
 import os
-import time
+import signal
 import traceback
-from PIL import Image, UnidentifiedImageError
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, UnidentifiedImageError, TiffImagePlugin
 import sys # 用于可能的 fallback 输出
 
 # 使用相对导入来获取配置
 from . import config
 # 不再直接从 core 调用 get_text 或 log_utils
-# 导入 state 中的函数，但调用将在本文件中进行
-from .state import save_processed_file_to_dir
+# 状态文件由主进程统一读取 (提交前过滤已处理的文件) 和写入 (根据返回结果)，子进程不访问状态文件
+from . import backends
+
+# Pillow 的分块分配器默认不缓存释放的内存块；在工作进程中保留少量块供下一张图片复用，
+# 避免同尺寸图片反复 malloc/free 和缺页。已通过 PILLOW_BLOCKS_MAX 环境变量设置时不覆盖。
+if config.PILLOW_BLOCKS_MAX > 0 and 'PILLOW_BLOCKS_MAX' not in os.environ:
+    Image.core.set_blocks_max(config.PILLOW_BLOCKS_MAX)
+
+# --- 模块级常量：扩展名到 Pillow 格式名的映射，以及倾向无损编码的格式 ---
+_EXT_TO_FORMAT = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.bmp': 'BMP', '.tif': 'TIFF', '.tiff': 'TIFF'}
+_LOSSLESS_PRONE_FORMATS = frozenset({'PNG', 'BMP', 'TIFF'})
+_LOSSLESS_PRONE_EXTS = frozenset({'.png', '.bmp', '.tif', '.tiff'})
+# WebP 格式允许的最大宽/高 (像素)
+_WEBP_MAX_DIMENSION = 16383
 
 # --- 辅助函数：安全删除文件 ---
 def _safe_remove(file_path):
     """尝试删除文件，忽略不存在错误，返回是否成功以及错误消息（如果失败）"""
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        os.remove(file_path) # 直接删除，不先 exists() 多做一次 stat
+        return True, None
+    except FileNotFoundError:
         return True, None
     except OSError as e:
         # 返回错误信息，让调用者记录日志
         err_msg = f"Failed to remove {file_path}: {e}"
         return False, err_msg
 
+# --- 辅助函数：一次性写出已编码的字节 ---
+def _write_encoded_file(file_path, data):
+    """
+    把内存中已编码好的图片字节一次写入 file_path 并刷到磁盘。
+    调用者随后用 os.replace 原子地替换目标文件，磁盘上不会出现半写的目标文件。
+    本次运行不会再读取输出文件：刷盘后其页面已是干净页，提示内核直接丢弃，不与其他工作进程争用页缓存。
+    """
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+# --- 辅助函数：只读文件头识别图片格式 ---
+# Pillow 接受的全部 TIFF 文件头 (大端/小端、BigTIFF 及其变体)，直接取自 TiffImagePlugin，保持与 Pillow 一致
+_TIFF_PREFIXES = tuple(TiffImagePlugin.PREFIXES)
+
+def _sniff_format(file_path):
+    """
+    根据文件开头的魔数返回 Pillow 格式名 ('JPEG'/'PNG'/'BMP'/'TIFF')，无法识别时返回 None；读取失败时抛出 OSError。
+    只读取 12 个字节，不创建 Pillow 图像对象。
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(12)
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(backends.PNG_SIGNATURE):
+        return 'PNG'
+    if head.startswith(b'BM'):
+        return 'BMP'
+    if head.startswith(_TIFF_PREFIXES):
+        return 'TIFF'
+    return None
+
+def _jpeg_header_valid(image_path):
+    """只解析 JPEG 文件头 (SOS 之前的标记段和 SOF 中的尺寸)，不解码像素；Pillow 无法解析时返回 False"""
+    try:
+        with Image.open(image_path, formats=('JPEG',)) as img:
+            return img.width > 0 and img.height > 0
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        return False
+
+def _open_image(image_path, sniffed_format):
+    """
+    打开图片。文件头已识别出格式时只让 Pillow 尝试该格式的插件，省去逐个插件探测；
+    未识别、或该插件无法打开时按 Pillow 默认顺序尝试全部插件 (例如扩展名为 .png 的 GIF 文件)。
+    """
+    if sniffed_format is not None:
+        try:
+            return Image.open(image_path, formats=(sniffed_format,))
+        except UnidentifiedImageError:
+            pass
+    return Image.open(image_path)
+
+# --- 辅助函数：决定保存为 WebP 前的目标模式 ---
+def _webp_target_mode(img):
+    """返回保存为 WebP 前需要转换到的模式 ('RGB'/'RGBA')；已是 RGB/RGBA 时返回 None"""
+    if img.mode in ('RGB', 'RGBA'):
+        return None
+    # 只有真正带透明信息的图像才需要 alpha 通道 (如 LA/PA，或带 transparency 的 P/L 图像)
+    if 'A' in img.mode or 'transparency' in img.info:
+        return 'RGBA'
+    return 'RGB'
+
+# --- 辅助函数：把透明图像合成到纯色背景上 (用于保存 JPEG) ---
+def _flatten_alpha_to_rgb(img, background):
+    """
+    返回把 img 的透明部分合成到 background 颜色上的 RGB 图像。
+    RGBA/RGBa/LA 图像直接作为 paste 的源与蒙版 (Pillow 取其 alpha 通道)，
+    只分配一个 RGB 缓冲区，不需要 split() 出各通道或中间的 RGBA 背景；其他模式先转换为 RGBA。
+    """
+    rgba = img if img.mode in ('RGBA', 'RGBa', 'LA') else img.convert('RGBA')
+    flattened = Image.new('RGB', rgba.size, background)
+    flattened.paste(rgba, mask=rgba)
+    return flattened
+
 # --- 核心压缩逻辑 (原格式压缩模式) ---
 # 修改：确保所有 log_messages 使用文本 key
-def compress_image_inplace(image_path_raw, processed_in_dir_set, dir_state_file,
-                           dir_log_file_name, quality, png_optimize, lock):
+def compress_image_inplace(image_path_raw,
+                           dir_log_file_name, quality, png_optimize):
     """
     压缩单个图片文件并替换原文件 (保留原始格式)。
     在并发环境中使用，不直接记录日志，而是返回结果和日志消息。
-    需要传入 multiprocessing.Lock 用于状态文件写入。
-    返回: 字典 {'status': 'success'/'skipped'/'error',
+    不写状态文件：status 为 'success' 时由主进程把 original_filename 记入状态文件。
+    返回: 字典 {'status': 'success'/'error',
                  'original_size': int/None,
                  'output_size': int/None,
                  'log_messages': [(level, message_key_or_raw, kwargs, to_dir_log, context_kwargs)],
@@ -42,8 +140,7 @@ def compress_image_inplace(image_path_raw, processed_in_dir_set, dir_state_file,
                  'file_path': str}
     """
     image_path = os.path.normpath(image_path_raw)
-    dir_path = os.path.dirname(image_path)
-    file_name = os.path.basename(image_path)
+    dir_path, file_name = os.path.split(image_path) # 一次拆分得到目录和文件名
     log_messages = []
     result = {
         'status': 'error', # 默认失败
@@ -56,11 +153,7 @@ def compress_image_inplace(image_path_raw, processed_in_dir_set, dir_state_file,
     }
     context = {'path': image_path, 'dir_path': dir_path}
 
-    # 1. 检查是否已处理
-    if file_name in processed_in_dir_set:
-        log_messages.append(('debug', "compress_skip_processed", {'state_file': os.path.basename(dir_state_file), 'path': image_path}, False, context))
-        result['status'] = 'skipped'
-        return result
+    # 1. 已处理的文件由主进程在提交任务前按状态文件过滤，这里无需再检查
 
     # 2. 记录开始处理日志
     log_messages.append(('info', "compress_start_path", {'path': image_path}, False, context))
@@ -70,7 +163,7 @@ def compress_image_inplace(image_path_raw, processed_in_dir_set, dir_state_file,
     original_size = None
     original_size_mb = 0
     try:
-        original_size = os.path.getsize(image_path)
+        original_size = os.stat(image_path).st_size
         original_size_mb = original_size / (1024 * 1024)
         log_messages.append(('info', "compress_file_size", {'size': original_size_mb}, False, context)) # 记录 MB 大小到全局日志
         # 目录日志仍然记录原始文件名和 MB 大小
@@ -82,121 +175,261 @@ def compress_image_inplace(image_path_raw, processed_in_dir_set, dir_state_file,
         result['error_details'] = f"Cannot get original size: {e}" # 保持英文错误细节
         return result
 
-    # 4. 定义临时文件路径
-    pid = os.getpid()
-    timestamp = int(time.time() * 1000)
-    temp_suffix = f".{timestamp}_{pid}.compress_temp"
-    temp_path = os.path.join(dir_path, f"{file_name}{temp_suffix}")
+    # 只读文件头确定格式，决定是否需要打开 Pillow
+    try:
+        sniffed_format = _sniff_format(image_path)
+    except OSError as e:
+        log_messages.append(('error', "compress_io_error_path", {'path': image_path, 'error': e}, False, context))
+        log_messages.append(('error', "compress_io_error", {'filename': file_name, 'error': e}, True, context))
+        result['error_details'] = f"IO/OS Error during processing: {e}"
+        return result
+    # 文件头未识别 (sniffed_format 为 None) 时不在这里拒绝：由 _open_image 交给 Pillow 按全部插件尝试，接受的文件与 Pillow 一致
+    is_large_file = original_size_mb > config.INPLACE_LARGE_FILE_THRESHOLD_MB
+    preserve_meta = original_size >= config.PRESERVE_METADATA_MIN_SIZE_KB * 1024
+
+    # 小 JPEG 不必解码：魔数之外还要求 Pillow 能解析出完整的 JPEG 文件头，才记为已处理并保留原文件；
+    # 文件头损坏的文件继续走正常流程，打开时报错，不会被记入状态文件
+    if original_size_mb < config.INPLACE_SKIP_SMALL_JPEG_MB and sniffed_format == 'JPEG' and _jpeg_header_valid(image_path):
+        log_messages.append(('info', "compress_small_jpeg_kept_path", {'threshold': config.INPLACE_SKIP_SMALL_JPEG_MB, 'path': image_path}, False, context))
+        log_messages.append(('info', "compress_small_jpeg_kept", {'threshold': config.INPLACE_SKIP_SMALL_JPEG_MB, 'filename': file_name}, True, context))
+        result['output_size'] = original_size
+        result['status'] = 'success'
+        return result
+
+    # 4. 定义临时文件路径：同一次运行中每个源文件只处理一次，源文件名加进程号即可保证唯一，无需时间戳
+    temp_path = os.path.join(dir_path, f"{file_name}.{os.getpid()}.compress_temp")
     compressed_size = None
+    temp_created = False # 只有真正开始写临时文件后，出错时才需要清理
 
     # 5. 打开、处理、保存到临时文件
     img_to_save = None
     img = None # 确保 img 在 finally 中可用
     try:
-        with Image.open(image_path) as img:
-            log_messages.append(('debug', "compress_open_success", {'path': image_path}, False, context))
-            original_format = img.format
-            if not original_format:
-                ext_lower = os.path.splitext(image_path)[1].lower()
-                format_map = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.bmp': 'BMP', '.tif': 'TIFF', '.tiff': 'TIFF'}
-                original_format = format_map.get(ext_lower)
-                if not original_format:
-                    log_messages.append(('warning', "compress_format_unknown_path", {'path': image_path, 'ext': ext_lower}, False, context))
-                    log_messages.append(('warning', "compress_format_unknown", {'filename': file_name, 'ext': ext_lower}, True, context))
-                    result['error_details'] = f"Unknown format extension: {ext_lower}"
+        encoded_bytes = None
+        if sniffed_format == 'JPEG':
+            # 已按不高于目标的质量编码过的 JPEG，重新编码只会增加损失而几乎不变小：从量化表估算质量，只做无损优化
+            already_low_quality = False
+            if config.INPLACE_JPEG_QUALITY_MARGIN is not None:
+                target_quality = config.INPLACE_LARGE_FILE_COMPRESSION_QUALITY if is_large_file else quality
+                estimated_quality = backends.estimate_jpeg_quality(image_path)
+                if estimated_quality is not None and estimated_quality <= target_quality + config.INPLACE_JPEG_QUALITY_MARGIN:
+                    already_low_quality = True
+                    log_messages.append(('info', "compress_low_quality_jpeg_path", {'estimated': estimated_quality, 'quality': target_quality, 'path': image_path}, False, context))
+                    log_messages.append(('info', "compress_low_quality_jpeg", {'estimated': estimated_quality, 'quality': target_quality, 'filename': file_name}, True, context))
+            # 无损优化路径：完全不经过 Pillow (不解码也不重新编码)。优先在进程内调用 mozjpeg (受 INPLACE_USE_MOZJPEG 控制)；
+            # jpegtran 需要启动子进程，只用于足够大的文件以摊薄启动开销
+            lossless_only = already_low_quality or (config.INPLACE_JPEG_LOSSLESS_OPTIMIZE and not is_large_file)
+            if lossless_only and config.INPLACE_USE_MOZJPEG and backends.mozjpeg_available():
+                with open(image_path, 'rb') as src_file:
+                    encoded_bytes = backends.mozjpeg_optimize(src_file.read())
+            elif lossless_only and backends.jpegtran_available() and original_size_mb >= config.INPLACE_JPEGTRAN_MIN_MB:
+                encoded_bytes = backends.jpegtran_optimize(image_path)
+            if lossless_only:
+                if encoded_bytes is not None:
+                    log_messages.append(('debug', "compress_jpegtran", {'path': image_path}, False, context))
+                else:
+                    # 只做无损优化时绝不按所选质量重新编码：没有可用的无损工具 (或文件小于 jpegtran 的大小下限、优化没有收益) 时保留原图并记为已处理
+                    log_messages.append(('info', "compress_lossless_kept_path", {'path': image_path}, False, context))
+                    log_messages.append(('info', "compress_lossless_kept", {'filename': file_name}, True, context))
+                    result['output_size'] = original_size
+                    result['status'] = 'success'
                     return result
-
-            log_messages.append(('debug', "compress_format_identified", {'format': original_format, 'path': image_path}, False, context))
-
-            save_options = {'format': original_format}
-            img_to_save = img
-            current_jpeg_quality = quality
-
-            is_large_file = original_size_mb > config.INPLACE_LARGE_FILE_THRESHOLD_MB
-            if original_format == 'JPEG' and is_large_file:
-                current_jpeg_quality = config.INPLACE_LARGE_FILE_COMPRESSION_QUALITY
-                log_messages.append(('info', "compress_large_file", {'threshold': config.INPLACE_LARGE_FILE_THRESHOLD_MB, 'quality': current_jpeg_quality}, False, context))
-                log_messages.append(('info', "compress_large_file_log", {'filename': file_name, 'threshold': config.INPLACE_LARGE_FILE_THRESHOLD_MB, 'quality': current_jpeg_quality}, True, context))
-
-            if original_format == 'JPEG':
-                save_options['quality'] = current_jpeg_quality
-                save_options['optimize'] = True
-                icc_profile = img.info.get('icc_profile')
-                if icc_profile: save_options['icc_profile'] = icc_profile
-                exif = img.info.get('exif')
-                if exif: save_options['exif'] = exif
-                # 检查 RGBA 或带透明度的 P 模式
-                if img.mode in ('RGBA', 'P'):
-                     has_transparency = 'transparency' in img.info
-                     if img.mode == 'RGBA' or (img.mode == 'P' and has_transparency) :
-                        log_messages.append(('debug', "compress_rgba_to_rgb", {'path': image_path}, False, context))
-                        log_messages.append(('debug', "compress_rgba_to_rgb_log", {'filename': file_name}, True, context))
-                        try:
-                            # 创建副本进行转换，避免修改原始 img 对象
-                            img_converted = img.convert('RGB')
-                            img_to_save = img_converted # 使用转换后的图像进行保存
-                        except Exception as convert_err:
-                             # 如果转换失败，记录警告，但仍然尝试保存原始图像（可能失败）
-                             log_messages.append(('warning', "compress_rgba_to_rgb_log", {'filename': file_name, 'error': convert_err}, True, context)) # 添加错误信息
-                             # 保持 img_to_save 为原始 img
-            elif original_format == 'PNG':
-                save_options['optimize'] = png_optimize
-            # 其他格式（BMP, TIFF）通常没有太多可配置的压缩选项，除了 optimize
-            # Pillow 会根据格式应用合理的默认值
-            else:
-                 log_messages.append(('debug', "compress_default_save", {'format': original_format, 'path': image_path}, False, context))
-
-            img_to_save.save(temp_path, **save_options)
+        elif sniffed_format == 'PNG':
+            if config.INPLACE_PNG_ALLOW_LOSSY and backends.pngquant_available():
+                # 有损调色板量化：由 pngquant 直接读取原文件，不经过 Pillow
+                encoded_bytes = backends.pngquant_quantize(image_path, config.INPLACE_PNGQUANT_QUALITY, config.INPLACE_PNGQUANT_SPEED)
+                if encoded_bytes is None:
+                    log_messages.append(('debug', "compress_pngquant_fallback", {'path': image_path}, False, context))
+                else:
+                    log_messages.append(('debug', "compress_pngquant", {'quality': config.INPLACE_PNGQUANT_QUALITY, 'path': image_path}, False, context))
+            if encoded_bytes is None and png_optimize and config.INPLACE_USE_OXIPNG and backends.oxipng_available():
+                # 无损优化：原文件字节直接交给 oxipng，省去 Pillow 的解码、滤波选择和 DEFLATE
+                with open(image_path, 'rb') as src_file:
+                    encoded_bytes = backends.oxipng_optimize(src_file.read(), config.INPLACE_OXIPNG_LEVEL)
+                if encoded_bytes is None:
+                    log_messages.append(('debug', "compress_oxipng_fallback", {'path': image_path}, False, context))
+                else:
+                    log_messages.append(('debug', "compress_oxipng", {'level': config.INPLACE_OXIPNG_LEVEL, 'path': image_path}, False, context))
+
+        if encoded_bytes is None:
+            with _open_image(image_path, sniffed_format) as img:
+                log_messages.append(('debug', "compress_open_success", {'path': image_path}, False, context))
+                original_format = img.format
+                if not original_format:
+                    ext_lower = os.path.splitext(file_name)[1].lower()
+                    original_format = _EXT_TO_FORMAT.get(ext_lower)
+                    if not original_format:
+                        log_messages.append(('warning', "compress_format_unknown_path", {'path': image_path, 'ext': ext_lower}, False, context))
+                        log_messages.append(('warning', "compress_format_unknown", {'filename': file_name, 'ext': ext_lower}, True, context))
+                        result['error_details'] = f"Unknown format extension: {ext_lower}"
+                        return result
+
+                log_messages.append(('debug', "compress_format_identified", {'format': original_format, 'path': image_path}, False, context))
+
+                save_options = {'format': original_format}
+                img_to_save = img
+                current_jpeg_quality = quality
+                use_turbojpeg = False
+                use_libdeflate = False
+                use_opencv = False
+                use_mozjpeg = False
+                drafted = False
+                draft_denominator = 1
+
+                if original_format == 'JPEG' and is_large_file:
+                    current_jpeg_quality = config.INPLACE_LARGE_FILE_COMPRESSION_QUALITY
+                    log_messages.append(('info', "compress_large_file", {'threshold': config.INPLACE_LARGE_FILE_THRESHOLD_MB, 'quality': current_jpeg_quality}, False, context))
+                    log_messages.append(('info', "compress_large_file_log", {'filename': file_name, 'threshold': config.INPLACE_LARGE_FILE_THRESHOLD_MB, 'quality': current_jpeg_quality}, True, context))
+                    use_mozjpeg = config.INPLACE_USE_MOZJPEG and backends.mozjpeg_available()
+                    draft_scale = config.INPLACE_LARGE_FILE_DRAFT_SCALE
+                    if draft_scale > 1:
+                        # 解码前调用 draft，libjpeg 在 IDCT 阶段就按 1/N 缩放，不会生成全分辨率的像素缓冲
+                        original_dimensions = img.size
+                        draft_result = img.draft(img.mode, (max(1, img.width // draft_scale), max(1, img.height // draft_scale)))
+                        if draft_result is not None:
+                            # Pillow 只支持 1/2/4/8，实际采用的比例按 draft 返回的区域 (原图坐标) 计算，不直接使用配置值
+                            draft_denominator = round(original_dimensions[0] / draft_result[1][2])
+                            drafted = draft_denominator > 1
+                        if drafted:
+                            log_messages.append(('info', "compress_large_file_draft", {'orig_w': original_dimensions[0], 'orig_h': original_dimensions[1], 'w': img.width, 'h': img.height, 'path': image_path}, False, context))
+                            log_messages.append(('info', "compress_large_file_draft_log", {'filename': file_name, 'orig_w': original_dimensions[0], 'orig_h': original_dimensions[1], 'w': img.width, 'h': img.height}, True, context))
+
+                if not preserve_meta and ('icc_profile' in img.info or 'exif' in img.info):
+                    log_messages.append(('debug', "core_strip_metadata", {'threshold': config.PRESERVE_METADATA_MIN_SIZE_KB, 'path': image_path}, False, context))
+
+                if original_format == 'JPEG':
+                    save_options['quality'] = current_jpeg_quality
+                    save_options['optimize'] = True
+                    icc_profile = img.info.get('icc_profile')
+                    if icc_profile and preserve_meta: save_options['icc_profile'] = icc_profile
+                    exif = img.info.get('exif')
+                    if exif and preserve_meta: save_options['exif'] = exif
+                    # 检查 RGBA 或带透明度的 P 模式
+                    if img.mode in ('RGBA', 'LA', 'P'):
+                         has_transparency = 'transparency' in img.info
+                         if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and has_transparency) :
+                            log_messages.append(('debug', "compress_rgba_to_rgb", {'path': image_path}, False, context))
+                            log_messages.append(('debug', "compress_rgba_to_rgb_log", {'filename': file_name}, True, context))
+                            try:
+                                # 合成到背景色上，避免透明区域在 JPEG 中变成未定义的底色
+                                img_to_save = _flatten_alpha_to_rgb(img, config.INPLACE_FLATTEN_BACKGROUND)
+                            except Exception as convert_err:
+                                 # 如果转换失败，记录警告，但仍然尝试保存原始图像（可能失败）
+                                 log_messages.append(('warning', "compress_rgba_to_rgb_log", {'filename': file_name, 'error': convert_err}, True, context)) # 添加错误信息
+                                 # 保持 img_to_save 为原始 img
+                    # libjpeg-turbo 直连路径：仅用于无需模式转换的 JPEG，EXIF/ICC 段从源文件原样拼接；已 draft 时按同一比例缩放解码
+                    if config.INPLACE_USE_TURBOJPEG and backends.turbojpeg_available():
+                        if img.mode not in ('RGB', 'L'):
+                            log_messages.append(('debug', "compress_turbojpeg_fallback", {'path': image_path, 'reason': img.mode}, False, context))
+                        else:
+                            use_turbojpeg = True
+                elif original_format == 'PNG':
+                    if not preserve_meta:
+                        save_options['icc_profile'] = None # Pillow 保存 PNG 时默认沿用 img.info 中的 ICC
+                    # 启用 PNG 优化时使用配置的 zlib 级别 (optimize=True 会强制最慢的 9 级)，未启用时不指定级别，沿用 Pillow 默认值
+                    png_level = config.INPLACE_PNG_COMPRESS_LEVEL if png_optimize else None
+                    if png_optimize and config.INPLACE_USE_LIBDEFLATE and backends.libdeflate_available():
+                        # 最终的 DEFLATE 由 libdeflate 完成，Pillow 只需选出滤波方式，用最快的 zlib 级别即可
+                        save_options['compress_level'] = 1
+                        use_libdeflate = True
+                    elif config.INPLACE_USE_OPENCV_PNG and backends.opencv_available():
+                        # OpenCV 只输出像素数据：需要保留调色板、透明色或 ICC 时仍走 Pillow
+                        if img_to_save.mode not in ('RGB', 'RGBA', 'L') or 'transparency' in img.info or (preserve_meta and img.info.get('icc_profile')):
+                            log_messages.append(('debug', "compress_opencv_fallback", {'path': image_path, 'mode': img_to_save.mode}, False, context))
+                        else:
+                            use_opencv = True
+                    if not use_libdeflate and not use_opencv:
+                        if png_optimize and config.INPLACE_PNG_FORCE_OPTIMIZE:
+                            save_options['optimize'] = True
+                        elif png_level is not None:
+                            save_options['compress_level'] = png_level
+                # 其他格式（BMP, TIFF）通常没有太多可配置的压缩选项，除了 optimize
+                # Pillow 会根据格式应用合理的默认值
+                else:
+                     log_messages.append(('debug', "compress_default_save", {'format': original_format, 'path': image_path}, False, context))
+
+                if use_turbojpeg:
+                    # Pillow 此时只解析了文件头，像素解码与编码全部在 libjpeg-turbo 中完成
+                    with open(image_path, 'rb') as src_file:
+                        encoded_bytes = backends.turbojpeg_recompress(src_file.read(), current_jpeg_quality,
+                                                                      draft_denominator,
+                                                                      keep_metadata=preserve_meta)
+                    if encoded_bytes is None:
+                        log_messages.append(('debug', "compress_turbojpeg_fallback", {'path': image_path, 'reason': 'colorspace'}, False, context))
+                    else:
+                        log_messages.append(('debug', "compress_turbojpeg", {'quality': current_jpeg_quality, 'path': image_path}, False, context))
+                if use_opencv:
+                    # OpenCV 必须显式给出级别：未启用 PNG 优化时用与 Pillow/zlib 默认值相同的 6 级
+                    opencv_level = png_level if png_level is not None else 6
+                    encoded_bytes = backends.opencv_encode_png(img_to_save, opencv_level)
+                    if encoded_bytes is None:
+                        if png_level is not None:
+                            save_options['compress_level'] = png_level # 回退到 Pillow 时使用同一级别
+                    else:
+                        log_messages.append(('debug', "compress_opencv", {'level': opencv_level, 'path': image_path}, False, context))
+
+                if encoded_bytes is None:
+                    # 先编码到内存，输出大小直接取 len()，无需再去磁盘上检查临时文件
+                    out_buffer = io.BytesIO()
+                    img_to_save.save(out_buffer, **save_options)
+                    encoded_bytes = out_buffer.getbuffer()
+                    out_buffer = None # memoryview 持有缓冲区，写盘后置空 encoded_bytes 即整体释放
+                    if use_libdeflate:
+                        recompressed = backends.libdeflate_recompress_png(encoded_bytes, config.INPLACE_LIBDEFLATE_LEVEL)
+                        if recompressed is not None:
+                            encoded_bytes = recompressed
+                            log_messages.append(('debug', "compress_libdeflate", {'level': config.INPLACE_LIBDEFLATE_LEVEL, 'path': image_path}, False, context))
+                if use_mozjpeg:
+                    optimized = backends.mozjpeg_optimize(encoded_bytes)
+                    if optimized is not None:
+                        log_messages.append(('debug', "compress_mozjpeg", {'before': len(encoded_bytes), 'after': len(optimized), 'path': image_path}, False, context))
+                        encoded_bytes = optimized
         # 确保 with 语句结束后 img 已关闭
         img = None # 表示 img 已通过 with 关闭
-
-        log_messages.append(('debug', "compress_save_temp_success", {'path': temp_path}, False, context))
-
-        # 6. 检查临时文件
-        if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+        # 写盘和替换之前就释放转换后的像素缓冲，之后只保留编码结果
+        if img_to_save is not None:
+            img_to_save.close()
+            img_to_save = None
+
+        # 6. 检查编码结果
+        compressed_size = len(encoded_bytes)
+        if compressed_size == 0:
             log_messages.append(('error', "compress_temp_invalid_path", {'path': temp_path, 'original_path': image_path}, False, context))
             log_messages.append(('error', "compress_temp_invalid", {'filename': file_name}, True, context))
-            result['error_details'] = "Invalid temp file created"
-            removed, rm_msg = _safe_remove(temp_path)
-            if not removed: log_messages.append(('error', "compress_temp_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
+            result['error_details'] = "Encoder produced no data"
             return result
 
-        compressed_size = os.path.getsize(temp_path)
+        # 收益不足时不写回：保留原图，并记为已处理以免下次重复尝试
+        if compressed_size >= original_size * config.INPLACE_MIN_SAVINGS_RATIO:
+            log_messages.append(('info', "compress_no_gain_kept_path", {'path': image_path, 'orig': original_size, 'comp': compressed_size}, False, context))
+            log_messages.append(('info', "compress_no_gain_kept", {'filename': file_name, 'orig': original_size, 'comp': compressed_size}, True, context))
+            result['output_size'] = original_size
+            result['status'] = 'success'
+            return result
         result['output_size'] = compressed_size
 
-        # 7. 删除原图
-        removed, rm_msg = _safe_remove(image_path)
-        if not removed:
-            log_messages.append(('error', "compress_remove_original_fail_path", {'path': image_path, 'error': rm_msg, 'temp_path': temp_path}, False, context))
-            log_messages.append(('error', "compress_remove_original_fail", {'filename': file_name, 'error': rm_msg, 'temp_filename': os.path.basename(temp_path)}, True, context))
-            result['error_details'] = f"Failed to remove original file: {rm_msg}"
-            return result
-        else:
-             log_messages.append(('debug', "compress_remove_original_success", {'path': image_path}, False, context))
+        # 7. 一次性写入临时文件
+        temp_created = True # 写入中途失败也可能留下部分临时文件
+        _write_encoded_file(temp_path, encoded_bytes)
+        encoded_bytes = None
+        log_messages.append(('debug', "compress_save_temp_success", {'path': temp_path}, False, context))
 
-        # 8. 重命名临时文件
+        # 8. 用临时文件原子替换原图 (失败时原图保持不变)
         try:
-            os.rename(temp_path, image_path)
+            os.replace(temp_path, image_path)
+            temp_created = False
             compressed_size_mb = compressed_size / (1024 * 1024)
             reduction_percent = ((original_size - compressed_size) / original_size) * 100 if original_size > 0 else 0
             log_messages.append(('info', "compress_rename_success_path", {'path': image_path, 'orig_mb': original_size_mb, 'comp_mb': compressed_size_mb}, False, context))
             log_messages.append(('info', "compress_rename_success", {'filename': file_name, 'orig_mb': original_size_mb, 'comp_mb': compressed_size_mb, 'percent': reduction_percent}, True, context))
         except OSError as e:
-            log_messages.append(('critical', "compress_rename_fail_path", {'temp_path': temp_path, 'path': image_path, 'error': e}, False, context))
-            log_messages.append(('critical', "compress_rename_fail", {'temp_filename': os.path.basename(temp_path), 'filename': file_name, 'error': e}, True, context))
-            result['error_details'] = f"CRITICAL: Failed to rename temp file {temp_path} to {image_path} after deleting original: {e}. MANUAL INTERVENTION NEEDED!"
+            log_messages.append(('error', "compress_replace_fail_path", {'temp_path': temp_path, 'path': image_path, 'error': e}, False, context))
+            log_messages.append(('error', "compress_replace_fail", {'filename': file_name, 'error': e}, True, context))
+            result['error_details'] = f"Failed to replace {image_path} with temp file {temp_path}: {e}"
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('error', "compress_temp_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
             return result
 
-        # 9. 记录处理成功状态
-        try:
-            save_processed_file_to_dir(None, dir_state_file, file_name, lock)
-        except Exception as state_save_e:
-             log_messages.append(('error', "log_save_state_fail", {'path': dir_state_file, 'filename': file_name, 'error': state_save_e}, False, context))
-             result['error_details'] = f"File processed but failed to save state: {state_save_e}"
-             # 即使状态保存失败，文件本身处理成功了，所以状态设为 success，但带错误信息
-             result['status'] = 'success' # 文件已替换，标记为成功，但错误信息会记录
-             return result
-
         result['status'] = 'success'
         return result
 
@@ -205,23 +438,26 @@ def compress_image_inplace(image_path_raw, processed_in_dir_set, dir_state_file,
         log_messages.append(('error', "compress_unidentified_path", {'path': image_path, 'error': e}, False, context)) # 添加 error
         log_messages.append(('error', "compress_unidentified", {'filename': file_name, 'error': e}, True, context)) # 添加 error
         result['error_details'] = f"UnidentifiedImageError: {e}"
-        removed, rm_msg = _safe_remove(temp_path)
-        if not removed: log_messages.append(('warning', "compress_unidentified_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
+        if temp_created:
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('warning', "compress_unidentified_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
         return result
     except (IOError, OSError) as e:
         log_messages.append(('error', "compress_io_error_path", {'path': image_path, 'error': e}, False, context))
         log_messages.append(('error', "compress_io_error", {'filename': file_name, 'error': e}, True, context))
         result['error_details'] = f"IO/OS Error during processing: {e}"
-        removed, rm_msg = _safe_remove(temp_path)
-        if not removed: log_messages.append(('error', "compress_unexpected_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context)) # 使用正确的 key
+        if temp_created:
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('error', "compress_unexpected_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context)) # 使用正确的 key
         return result
     except Exception as e:
         tb_str = traceback.format_exc()
         log_messages.append(('critical', "compress_unexpected_error_path", {'path': image_path, 'error': e}, False, context))
         log_messages.append(('critical', "compress_unexpected_error", {'filename': file_name, 'error': str(e), 'traceback': tb_str}, True, context))
-        result['error_details'] = f"Unexpected Error: {e}\n{tb_str}"
-        removed, rm_msg = _safe_remove(temp_path)
-        if not removed: log_messages.append(('error', "compress_unexpected_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
+        result['error_details'] = f"Unexpected Error: {e}" # 堆栈已随上面的 critical 消息返回，不再重复一份
+        if temp_created:
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('error', "compress_unexpected_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
         return result
     finally:
         # 确保即使在 with 语句内部发生异常，img 也能被关闭（如果它被成功打开）
@@ -236,13 +472,13 @@ def compress_image_inplace(image_path_raw, processed_in_dir_set, dir_state_file,
 
 # --- 核心转换逻辑 (WebP 模式 - 原地替换) ---
 # 修改：确保所有 log_messages 使用文本 key
-def convert_to_webp_inplace(image_path_raw, processed_in_dir_set, dir_state_file,
-                            dir_log_file_name, quality, use_lossless, lock):
+def convert_to_webp_inplace(image_path_raw,
+                            dir_log_file_name, quality, use_lossless):
     """
     将单个图片文件转换为 WebP 格式并替换原文件。
     在并发环境中使用，不直接记录日志，而是返回结果和日志消息。
-    需要传入 multiprocessing.Lock 用于状态文件写入。
-    返回: 字典 {'status': 'success'/'skipped'/'error',
+    不写状态文件：status 为 'success' 时由主进程把 original_filename 记入状态文件。
+    返回: 字典 {'status': 'success'/'error',
                  'original_size': int/None,
                  'output_size': int/None, # WebP 文件大小
                  'log_messages': [(level, message_key_or_raw, kwargs, to_dir_log, context_kwargs)],
@@ -251,9 +487,8 @@ def convert_to_webp_inplace(image_path_raw, processed_in_dir_set, dir_state_file
                  'file_path': str}
     """
     image_path = os.path.normpath(image_path_raw)
-    dir_path = os.path.dirname(image_path)
-    file_name = os.path.basename(image_path)
-    base_name, _ = os.path.splitext(file_name)
+    dir_path, file_name = os.path.split(image_path) # 一次拆分得到目录和文件名
+    base_name, original_ext = os.path.splitext(file_name)
     webp_file_name = base_name + ".webp"
     webp_output_path = os.path.join(dir_path, webp_file_name)
     log_messages = []
@@ -268,11 +503,7 @@ def convert_to_webp_inplace(image_path_raw, processed_in_dir_set, dir_state_file
     }
     context = {'path': image_path, 'dir_path': dir_path, 'webp_path': webp_output_path}
 
-    # 1. 检查是否已处理
-    if file_name in processed_in_dir_set:
-        log_messages.append(('debug', "convert_skip_processed", {'state_file': os.path.basename(dir_state_file), 'path': image_path}, False, context))
-        result['status'] = 'skipped'
-        return result
+    # 1. 已处理的文件由主进程在提交任务前按状态文件过滤，这里无需再检查
 
     # 2. 记录开始转换日志
     log_messages.append(('info', "convert_start_path", {'path': image_path, 'webp_path': webp_output_path}, False, context))
@@ -282,7 +513,7 @@ def convert_to_webp_inplace(image_path_raw, processed_in_dir_set, dir_state_file
     original_size = None
     original_size_mb = 0
     try:
-        original_size = os.path.getsize(image_path)
+        original_size = os.stat(image_path).st_size
         original_size_mb = original_size / (1024 * 1024)
         # 全局日志记录 MB 大小
         log_messages.append(('info', "convert_original_size", {'size': original_size_mb}, False, context))
@@ -295,135 +526,144 @@ def convert_to_webp_inplace(image_path_raw, processed_in_dir_set, dir_state_file
         result['error_details'] = f"Cannot get original size: {e}"
         return result
 
-    # 4. 定义临时文件路径
-    pid = os.getpid()
-    timestamp = int(time.time() * 1000)
-    temp_suffix = f".{timestamp}_{pid}.webp_temp"
-    temp_path = webp_output_path + temp_suffix
+    # 只读文件头检查格式：识别出的文件打开时只需尝试对应的 Pillow 插件，未识别的文件仍交给 Pillow 按全部插件尝试
+    try:
+        sniffed_format = _sniff_format(image_path)
+    except OSError as e:
+        log_messages.append(('error', "convert_io_error_path", {'path': image_path, 'error': e}, False, context))
+        log_messages.append(('error', "convert_io_error", {'filename': file_name, 'error': e}, True, context))
+        result['error_details'] = f"IO/OS Error during conversion: {e}"
+        return result
+
+    # 4. 定义临时文件路径：按源文件名命名 (a.jpg 与 a.png 对应同一个 a.webp，可能在同一进程的两个线程中同时处理)，
+    # 源文件名加进程号即可保证唯一，无需时间戳
+    temp_path = os.path.join(dir_path, f"{file_name}.{os.getpid()}.webp_temp")
     webp_size = None
+    temp_created = False # 只有真正开始写临时文件后，出错时才需要清理
 
     # 5. 打开、处理、保存为 WebP 到临时文件
     img_to_save = None
     img = None # 确保 img 在 finally 中可用
     try:
-        with Image.open(image_path) as img:
+        with _open_image(image_path, sniffed_format) as img:
             log_messages.append(('debug', "convert_open_success", {'path': image_path}, False, context))
 
+            # 只根据文件头中的尺寸判断：超出 WebP 上限的图像在解码前就拒绝，不必解码后才在保存时失败
+            if img.width > _WEBP_MAX_DIMENSION or img.height > _WEBP_MAX_DIMENSION:
+                log_messages.append(('error', "convert_too_large_path", {'path': image_path, 'width': img.width, 'height': img.height, 'max': _WEBP_MAX_DIMENSION}, False, context))
+                log_messages.append(('error', "convert_too_large", {'filename': file_name, 'width': img.width, 'height': img.height, 'max': _WEBP_MAX_DIMENSION}, True, context))
+                result['error_details'] = f"Image too large for WebP: {img.width}x{img.height} (max {_WEBP_MAX_DIMENSION})"
+                return result
+
             webp_save_options = {'quality': quality}
 
-            original_format_from_ext = os.path.splitext(image_path)[1].lower()
+            original_format_from_ext = original_ext.lower()
             # Pillow >= 9.1.0 推荐使用 img.format 获取格式
             original_format_from_img = img.format if hasattr(img, 'format') else None
-            lossless_prone_formats = ['PNG', 'BMP', 'TIFF']
-            lossless_prone_extensions = ['.png', '.bmp', '.tif', '.tiff']
 
             effective_lossless = use_lossless or \
-                                 (original_format_from_img and original_format_from_img.upper() in lossless_prone_formats) or \
-                                 (not original_format_from_img and original_format_from_ext in lossless_prone_extensions)
+                                 (original_format_from_img and original_format_from_img.upper() in _LOSSLESS_PRONE_FORMATS) or \
+                                 (not original_format_from_img and original_format_from_ext in _LOSSLESS_PRONE_EXTS)
 
             webp_save_options['lossless'] = effective_lossless
+            webp_method = config.WEBP_LOSSLESS_METHOD if effective_lossless else config.WEBP_METHOD
+            if config.WEBP_LARGE_IMAGE_PIXELS and img.width * img.height > config.WEBP_LARGE_IMAGE_PIXELS:
+                webp_method = max(0, webp_method - 1)
+            webp_save_options['method'] = webp_method
             log_lossless_mode_key = "convert_lossless" if effective_lossless else "convert_lossy"
 
             # 使用占位符 [[key]] 让主进程翻译
-            log_messages.append(('info', "convert_webp_options", {'quality': quality, 'mode': f'[[{log_lossless_mode_key}]]', 'path': webp_output_path}, False, context))
+            log_messages.append(('info', "convert_webp_options", {'quality': quality, 'mode': f'[[{log_lossless_mode_key}]]', 'method': webp_save_options['method'], 'path': webp_output_path}, False, context))
             log_messages.append(('info', "convert_webp_options_log", {'filename': file_name, 'webp_filename': webp_file_name, 'quality': quality, 'mode': f'[[{log_lossless_mode_key}]]'}, True, context))
 
-            icc_profile = img.info.get('icc_profile')
-            if icc_profile: webp_save_options['icc_profile'] = icc_profile
-            exif = img.info.get('exif')
-            if exif: webp_save_options['exif'] = exif
+            icc_profile = None
+            exif = None
+            if original_size >= config.PRESERVE_METADATA_MIN_SIZE_KB * 1024:
+                icc_profile = img.info.get('icc_profile')
+                if icc_profile: webp_save_options['icc_profile'] = icc_profile
+                exif = img.info.get('exif')
+                if exif: webp_save_options['exif'] = exif
+            elif 'icc_profile' in img.info or 'exif' in img.info:
+                log_messages.append(('debug', "core_strip_metadata", {'threshold': config.PRESERVE_METADATA_MIN_SIZE_KB, 'path': image_path}, False, context))
 
             img_to_save = img # 默认使用原始图像
             converted_img = None # 用于存储转换后的图像
 
-            # WebP 支持 RGB, RGBA。需要转换 P, LA 等模式。
-            if img.mode == 'P':
-                 try:
-                     log_messages.append(('debug', "core_convert_p_to_rgba", {'path': image_path}, False, context))
-                     converted_img = img.convert('RGBA')
-                     img_to_save = converted_img
-                 except Exception:
-                     try:
-                         log_messages.append(('debug', "core_convert_p_to_rgb", {'path': image_path}, False, context))
-                         converted_img = img.convert('RGB')
-                         img_to_save = converted_img
-                     except Exception as convert_err:
-                          log_messages.append(('warning', "core_convert_p_fail", {'path': image_path, 'error': convert_err}, False, context))
-                          # 保持 img_to_save 为原始 img，保存时可能会失败
-            elif img.mode == 'LA':
-                 log_messages.append(('debug', "core_convert_la_to_rgba", {'path': image_path}, False, context))
-                 converted_img = img.convert('RGBA')
-                 img_to_save = converted_img
-            elif img.mode not in ('RGB', 'RGBA'): # 处理其他可能不支持的模式，如 L, CMYK 等
-                 try:
-                     log_messages.append(('debug', "core_convert_other_to_rgb", {'mode': img.mode, 'path': image_path}, False, context))
-                     converted_img = img.convert('RGB')
-                     img_to_save = converted_img
-                 except Exception as convert_err:
-                     log_messages.append(('warning', "core_convert_other_fail", {'mode': img.mode, 'path': image_path, 'error': convert_err}, False, context))
-                     # 保持 img_to_save 为原始 img
-
-            img_to_save.save(temp_path, 'WEBP', **webp_save_options)
+            # WebP 只支持 RGB/RGBA：其余模式一次转换到目标模式，已是 RGB/RGBA 时不复制
+            target_mode = _webp_target_mode(img)
+            if target_mode:
+                try:
+                    log_messages.append(('debug', "core_convert_mode", {'mode': img.mode, 'target': target_mode, 'path': image_path}, False, context))
+                    converted_img = img.convert(target_mode)
+                    img_to_save = converted_img
+                except Exception as convert_err:
+                    log_messages.append(('warning', "core_convert_mode_fail", {'mode': img.mode, 'target': target_mode, 'path': image_path, 'error': convert_err}, False, context))
+                    # 保持 img_to_save 为原始 img，保存时可能会失败
+
+            encoded_bytes = None
+            if config.WEBP_USE_LIBWEBP and backends.libwebp_available():
+                if icc_profile or exif:
+                    log_messages.append(('debug', "convert_libwebp_fallback", {'path': image_path, 'reason': 'metadata'}, False, context))
+                elif img_to_save.mode not in ('RGB', 'RGBA'):
+                    log_messages.append(('debug', "convert_libwebp_fallback", {'path': image_path, 'reason': img_to_save.mode}, False, context))
+                else:
+                    encoded_bytes = backends.libwebp_encode(img_to_save, quality, bool(effective_lossless), webp_save_options['method'])
+                    log_messages.append(('debug', "convert_libwebp", {'path': image_path}, False, context))
+            if encoded_bytes is None:
+                # 先编码到内存，输出大小直接取 len()，无需再去磁盘上检查临时文件
+                out_buffer = io.BytesIO()
+                img_to_save.save(out_buffer, 'WEBP', **webp_save_options)
+                encoded_bytes = out_buffer.getbuffer()
+                out_buffer = None # memoryview 持有缓冲区，写盘后置空 encoded_bytes 即整体释放
         # 确保 with 语句结束后 img 已关闭
         img = None
-
-        log_messages.append(('debug', "convert_save_temp_success", {'path': temp_path}, False, context))
-
-        # 6. 检查临时 WebP 文件
-        if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+        # 写盘和替换之前就释放转换后的像素缓冲，之后只保留编码结果
+        if converted_img is not None:
+            converted_img.close()
+            converted_img = None
+        img_to_save = None
+
+        # 6. 检查编码结果
+        webp_size = len(encoded_bytes)
+        if webp_size == 0:
             log_messages.append(('error', "convert_temp_invalid_path", {'path': temp_path, 'original_path': image_path}, False, context))
             log_messages.append(('error', "convert_temp_invalid", {'filename': file_name}, True, context))
-            result['error_details'] = "Invalid temp WebP file created"
-            removed, rm_msg = _safe_remove(temp_path)
-            if not removed: log_messages.append(('error', "convert_temp_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
+            result['error_details'] = "Encoder produced no WebP data"
             return result
-
-        webp_size = os.path.getsize(temp_path)
         result['output_size'] = webp_size
 
-        # 7. 删除原图
-        removed, rm_msg = _safe_remove(image_path)
-        if not removed:
-            log_messages.append(('error', "convert_remove_original_fail_path", {'path': image_path, 'error': rm_msg, 'temp_path': temp_path}, False, context))
-            log_messages.append(('error', "convert_remove_original_fail", {'filename': file_name, 'error': rm_msg, 'temp_filename': os.path.basename(temp_path)}, True, context))
-            result['error_details'] = f"Failed to remove original file: {rm_msg}"
-            return result
-        else:
-             log_messages.append(('debug', "convert_remove_original_success", {'path': image_path}, False, context))
+        # 7. 一次性写入临时文件
+        temp_created = True # 写入中途失败也可能留下部分临时文件
+        _write_encoded_file(temp_path, encoded_bytes)
+        encoded_bytes = None
+        log_messages.append(('debug', "convert_save_temp_success", {'path': temp_path}, False, context))
 
-        # 8. 重命名临时文件为最终的 WebP 文件名
+        # 8. 用临时文件原子替换 (或创建) 最终的 WebP 文件；目标已存在或与其他文件同名的原图已由主进程在扫描时排除
         try:
-            if os.path.exists(webp_output_path):
-                 log_messages.append(('warning', "core_overwrite_webp_warn", {'path': webp_output_path}, False, context))
-                 removed, rm_msg = _safe_remove(webp_output_path)
-                 if not removed:
-                      log_messages.append(('error', "core_overwrite_webp_fail", {'path': webp_output_path, 'error': rm_msg}, False, context))
-                      # 使用已有的重命名失败 key，但提供更具体的错误信息
-                      rename_fail_error = f"Cannot remove existing file: {rm_msg}"
-                      log_messages.append(('critical', "convert_rename_fail_path", {'temp_path': temp_path, 'webp_path': webp_output_path, 'error': rename_fail_error}, False, context))
-                      log_messages.append(('critical', "convert_rename_fail", {'temp_filename': os.path.basename(temp_path), 'webp_filename': webp_file_name, 'error': rename_fail_error}, True, context))
-                      result['error_details'] = f"CRITICAL: Cannot remove existing target file {webp_output_path}. Original deleted! Manual intervention needed!"
-                      return result
-
-            os.rename(temp_path, webp_output_path)
-            webp_size_mb = webp_size / (1024 * 1024)
-            reduction_percent = ((original_size - webp_size) / original_size) * 100 if original_size > 0 else 0
-            log_messages.append(('info', "convert_rename_success_path", {'path': image_path, 'webp_path': webp_output_path, 'orig_mb': original_size_mb, 'webp_mb': webp_size_mb}, False, context))
-            log_messages.append(('info', "convert_rename_success", {'filename': file_name, 'webp_filename': webp_file_name, 'orig_mb': original_size_mb, 'webp_mb': webp_size_mb, 'percent': reduction_percent}, True, context))
+            os.replace(temp_path, webp_output_path)
+            temp_created = False
         except OSError as e:
-            log_messages.append(('critical', "convert_rename_fail_path", {'temp_path': temp_path, 'webp_path': webp_output_path, 'error': e}, False, context))
-            log_messages.append(('critical', "convert_rename_fail", {'temp_filename': os.path.basename(temp_path), 'webp_filename': webp_file_name, 'error': e}, True, context))
-            result['error_details'] = f"CRITICAL: Failed to rename temp file {temp_path} to {webp_output_path} after deleting original: {e}. MANUAL INTERVENTION NEEDED!"
+            log_messages.append(('error', "convert_replace_fail_path", {'temp_path': temp_path, 'webp_path': webp_output_path, 'error': e}, False, context))
+            log_messages.append(('error', "convert_replace_fail", {'filename': file_name, 'webp_filename': webp_file_name, 'error': e}, True, context))
+            result['error_details'] = f"Failed to move temp file {temp_path} to {webp_output_path}: {e}"
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('error', "convert_temp_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
             return result
 
-        # 9. 记录处理成功状态 (使用原始文件名记录状态)
-        try:
-            save_processed_file_to_dir(None, dir_state_file, file_name, lock)
-        except Exception as state_save_e:
-             log_messages.append(('error', "log_save_state_fail", {'path': dir_state_file, 'filename': file_name, 'error': state_save_e}, False, context))
-             result['error_details'] = f"File converted but failed to save state: {state_save_e}"
-             result['status'] = 'success' # 文件已转换，标记为成功
-             return result
+        # 9. WebP 已就位，再删除原图 (原图本身就是同名 .webp 时已被 os.replace 覆盖)
+        if image_path != webp_output_path:
+            removed, rm_msg = _safe_remove(image_path)
+            if not removed:
+                log_messages.append(('error', "convert_remove_original_fail_path", {'path': image_path, 'error': rm_msg, 'webp_path': webp_output_path}, False, context))
+                log_messages.append(('error', "convert_remove_original_fail", {'filename': file_name, 'error': rm_msg, 'webp_filename': webp_file_name}, True, context))
+                result['error_details'] = f"Failed to remove original file: {rm_msg}"
+                return result
+            log_messages.append(('debug', "convert_remove_original_success", {'path': image_path}, False, context))
+
+        webp_size_mb = webp_size / (1024 * 1024)
+        reduction_percent = ((original_size - webp_size) / original_size) * 100 if original_size > 0 else 0
+        log_messages.append(('info', "convert_rename_success_path", {'path': image_path, 'webp_path': webp_output_path, 'orig_mb': original_size_mb, 'webp_mb': webp_size_mb}, False, context))
+        log_messages.append(('info', "convert_rename_success", {'filename': file_name, 'webp_filename': webp_file_name, 'orig_mb': original_size_mb, 'webp_mb': webp_size_mb, 'percent': reduction_percent}, True, context))
 
         result['status'] = 'success'
         return result
@@ -433,30 +673,34 @@ def convert_to_webp_inplace(image_path_raw, processed_in_dir_set, dir_state_file
         log_messages.append(('error', "convert_unidentified_path", {'path': image_path, 'error': e}, False, context)) # 添加 error
         log_messages.append(('error', "convert_unidentified", {'filename': file_name, 'error': e}, True, context)) # 添加 error
         result['error_details'] = f"UnidentifiedImageError: {e}"
-        removed, rm_msg = _safe_remove(temp_path)
-        if not removed: log_messages.append(('warning', "convert_unidentified_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
+        if temp_created:
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('warning', "convert_unidentified_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
         return result
     except (IOError, OSError) as e:
         log_messages.append(('error', "convert_io_error_path", {'path': image_path, 'error': e}, False, context))
         log_messages.append(('error', "convert_io_error", {'filename': file_name, 'error': e}, True, context))
         result['error_details'] = f"IO/OS Error during conversion: {e}"
-        removed, rm_msg = _safe_remove(temp_path)
-        if not removed: log_messages.append(('error', "convert_unexpected_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context)) # 使用正确的 key
+        if temp_created:
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('error', "convert_unexpected_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context)) # 使用正确的 key
         return result
     except ValueError as e: # Pillow 保存 WebP 时可能因模式或选项问题抛出 ValueError
         log_messages.append(('error', "convert_value_error_path", {'webp_path': webp_output_path, 'error': e}, False, context))
         log_messages.append(('error', "convert_value_error", {'webp_filename': webp_file_name, 'error': str(e)}, True, context))
         result['error_details'] = f"ValueError on saving WebP (unsupported mode/options?): {e}"
-        removed, rm_msg = _safe_remove(temp_path)
-        if not removed: log_messages.append(('warning', "convert_value_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
+        if temp_created:
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('warning', "convert_value_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
         return result
     except Exception as e:
         tb_str = traceback.format_exc()
         log_messages.append(('critical', "convert_unexpected_error_path", {'path': image_path, 'error': e}, False, context))
         log_messages.append(('critical', "convert_unexpected_error", {'filename': file_name, 'error': str(e), 'traceback': tb_str}, True, context))
-        result['error_details'] = f"Unexpected Error: {e}\n{tb_str}"
-        removed, rm_msg = _safe_remove(temp_path)
-        if not removed: log_messages.append(('error', "convert_unexpected_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
+        result['error_details'] = f"Unexpected Error: {e}" # 堆栈已随上面的 critical 消息返回，不再重复一份
+        if temp_created:
+            removed, rm_msg = _safe_remove(temp_path)
+            if not removed: log_messages.append(('error', "convert_unexpected_error_clean_fail", {'path': temp_path, 'error': rm_msg}, False, context))
         return result
     finally:
         # 确保原始图像和转换后的图像都被关闭
@@ -467,4 +711,79 @@ def convert_to_webp_inplace(image_path_raw, processed_in_dir_set, dir_state_file
             try: converted_img.close()
             except Exception: pass
         # 如果 img_to_save 指向 converted_img，它已经被关闭了
-        # 如果 img_to_save 指向原始 img，它也应该被关闭了
\ No newline at end of file
+        # 如果 img_to_save 指向原始 img，它也应该被关闭了
+
+# --- 批量处理入口 (在工作进程中运行) ---
+# 回传主进程的单个文件结果。处理函数内部仍使用结果字典，回传前转换为元组：
+# 序列化时不再为每个文件重复写入字段名，主进程按属性读取。
+# log_messages 在日志经队列发送后为空元组。
+WorkerResult = namedtuple('WorkerResult', ['status', 'original_size', 'output_size', 'error_details', 'original_filename', 'log_messages'])
+
+# 主进程传入的日志队列；设置后 log_messages 经此队列交给主进程的后台日志线程，不再随结果返回
+_log_queue = None
+# 整个运行中所有任务都相同的处理参数 (目录日志文件名模板和模式参数)，追加在每个任务自身的参数之后
+_common_task_args = ()
+
+def init_worker(log_queue, common_task_args=()):
+    """
+    工作进程初始化函数 (ProcessPoolExecutor 的 initializer)，保存主进程的日志队列和各任务共用的参数，
+    这些参数每个工作进程只接收一次，不再随每个任务序列化。
+    同时预先注册 Pillow 的全部格式插件：Image.open 默认只预载常见格式，遇到第一个 TIFF 等文件时才导入其余插件。
+    """
+    global _log_queue, _common_task_args
+    _log_queue = log_queue
+    _common_task_args = tuple(common_task_args)
+    # 工作进程没有需要写入的缓冲，不沿用主进程 fork 过来的 SIGTERM 处理，进程池终止工作进程时直接退出
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    Image.init()
+
+def _run_task(process_func, task_args):
+    """
+    执行单个任务；处理函数意外抛出异常时转换为错误结果，避免影响同一批次的其他文件。
+    未启用 config.WORKER_DEBUG_MESSAGES 时，在回传主进程之前去掉只写全局日志的 debug 消息；
+    有日志队列时日志消息放入队列，返回的结果只剩状态和大小等字段。
+    返回 WorkerResult。
+    """
+    try:
+        result = process_func(*task_args, *_common_task_args)
+        if not config.WORKER_DEBUG_MESSAGES:
+            result['log_messages'] = [entry for entry in result['log_messages'] if entry[0] != 'debug' or entry[3]]
+        log_messages = result['log_messages']
+        if _log_queue is not None and log_messages:
+            _log_queue.put(log_messages) # 由队列的后台线程序列化发送，不阻塞处理
+            log_messages = ()
+        return WorkerResult(result['status'], result['original_size'], result['output_size'],
+                            result['error_details'], result['original_filename'], log_messages)
+    except Exception as e:
+        image_path = os.path.normpath(task_args[0])
+        return WorkerResult('error', None, None, f"Unexpected Error: {e}\n{traceback.format_exc()}",
+                            os.path.basename(image_path), ())
+
+def _prefetch_file(file_path):
+    """提示内核异步预读整个文件 (posix_fadvise WILLNEED)，不等待读完；不支持的平台上什么也不做"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass # 预读只是优化，失败时由正式处理流程报告错误
+
+def process_batch(process_func, task_args_list):
+    """
+    在一个工作进程内处理一批文件，按输入顺序返回每个文件的 WorkerResult 列表。
+    使用 config.BATCH_THREADS 个线程流水线处理：Pillow/libjpeg-turbo/libwebp 在解码、编码时释放 GIL，
+    一个文件编码写盘的同时下一个文件已经在读取解码。
+    """
+    if config.PREFETCH_FILES:
+        # 批次内的文件读取在后台进行，处理到某个文件时其内容大多已在页缓存中
+        for task_args in task_args_list:
+            _prefetch_file(task_args[0])
+    if len(task_args_list) == 1 or config.BATCH_THREADS <= 1:
+        return [_run_task(process_func, task_args) for task_args in task_args_list]
+    with ThreadPoolExecutor(max_workers=config.BATCH_THREADS) as pipeline:
+        return list(pipeline.map(lambda task_args: _run_task(process_func, task_args), task_args_list))
@@ -3,27 +3,94 @@
 
 import os
 import sys
+import queue
 import logging
 import logging.handlers
 import time
+import atexit
+import threading
 # 确保 get_text 在此模块加载时可用
 # 这依赖于 main.py 中在调用 setup_global_logger 之前设置语言
 from . import config
-from .utils import get_text # 导入 get_text
+from .utils import get_text, ensure_dir # 导入 get_text
 
 # 全局 logger 实例，由 setup_global_logger 初始化
 # 其他模块可以通过 get_logger() 获取，或者直接从 main 传递
 _logger = None
+# 在后台线程中把日志记录写入全局日志文件的监听器，由 setup_global_logger 启动
+_file_listener = None
+
+class CachedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    按大小轮转的文件处理器，减少每条日志的额外开销。
+    标准实现每次写入前都要 exists()+isfile() 两次 stat 并把记录多格式化一遍来判断是否轮转；
+    这里在打开文件时判断一次是否为普通文件，并按消息长度累计一个偏大的字节数估计值，
+    只有估计值接近 maxBytes 时才按实际文件位置精确判断。
+    文件按 UTF-8 写入，中文文件名、路径每个字符占 3 个字节：含非 ASCII 字符的消息按每字符 4 个字节 (UTF-8 的上限) 估计；
+    带异常回溯或调用栈的记录长度无法从消息估计，直接精确判断。
+    """
+
+    # 估计大小时为时间戳、级别、进程/线程、函数名等前缀预留的字符数 (宁大勿小)
+    _RECORD_OVERHEAD = 160
+
+    def _open(self):
+        stream = super()._open()
+        self._is_regular_file = os.path.isfile(self.baseFilename)
+        self._approx_size = stream.tell() # 追加模式打开后位于文件末尾
+        return stream
+
+    def shouldRollover(self, record):
+        if self.stream is None: # delay=True 时尚未打开
+            self.stream = self._open()
+        if self.maxBytes <= 0 or not self._is_regular_file:
+            return False
+        if not (record.exc_info or record.exc_text or record.stack_info):
+            message = record.getMessage()
+            self._approx_size += (len(message) if message.isascii() else len(message) * 4) + self._RECORD_OVERHEAD
+            if self._approx_size < self.maxBytes * 0.9:
+                return False
+        # 接近上限 (或无法估计)：按实际位置和编码后的字节数精确判断，并用实际大小校正估计值
+        msg = "%s\n" % self.format(record)
+        self.stream.seek(0, 2)
+        self._approx_size = self.stream.tell()
+        return self._approx_size + len(msg.encode(self.encoding or 'utf-8', 'replace')) >= self.maxBytes
+
+
+class BlockBufferedStreamHandler(logging.StreamHandler):
+    """
+    输出不是终端 (重定向到文件或管道) 时使用的控制台处理器。
+    标准 StreamHandler 每条记录后都 flush 一次，相当于每行一次 write 系统调用；
+    这里只在 WARNING 及以上级别、或距上次刷新超过 FLUSH_INTERVAL 秒时才 flush，其余交给流自身的块缓冲。
+    """
+
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self._last_flush = time.monotonic()
+
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            now = time.monotonic()
+            if record.levelno >= logging.WARNING or now - self._last_flush >= self.FLUSH_INTERVAL:
+                self.flush()
+                self._last_flush = now
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
 
 def setup_global_logger():
     """设置全局日志记录器"""
-    global _logger
+    global _logger, _file_listener
     run_state_abs_path = config.RUN_STATE_DIR # 使用 config 中的相对路径
     global_log_abs_path = os.path.join(run_state_abs_path, os.path.basename(config.GLOBAL_LOG_FILE_PATH))
 
     # 确保 RUN_STATE_DIR 存在
     try:
-        os.makedirs(run_state_abs_path, exist_ok=True)
+        ensure_dir(run_state_abs_path)
     except OSError as e:
         # 如果创建目录失败，这是一个严重问题，可能无法写入日志
         # 此时 get_text 可能还不可用，使用硬编码的英文+中文提示
@@ -46,7 +113,7 @@ def setup_global_logger():
 
     # 文件处理器 (DEBUG level)
     try:
-        file_handler = logging.handlers.RotatingFileHandler(
+        file_handler = CachedRotatingFileHandler(
             global_log_abs_path,
             encoding='utf-8',
             mode='a',
@@ -59,7 +126,13 @@ def setup_global_logger():
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         file_handler.setFormatter(file_formatter)
-        logger_instance.addHandler(file_handler)
+        # 调用线程只把记录放入队列，格式化和写盘由监听线程完成；控制台处理器仍然同步输出，
+        # 以免 INFO 消息与交互式提示的输出顺序错乱
+        file_queue = queue.Queue(-1)
+        _file_listener = logging.handlers.QueueListener(file_queue, file_handler, respect_handler_level=True)
+        _file_listener.start()
+        atexit.register(_file_listener.stop) # 退出时先写完队列中剩余的记录
+        logger_instance.addHandler(logging.handlers.QueueHandler(file_queue))
     except Exception as e:
         # 尝试使用 get_text 获取错误消息，如果 utils 初始化失败，则使用硬编码英文
         try:
@@ -73,7 +146,8 @@ def setup_global_logger():
         # 即使文件日志失败，仍然尝试设置控制台日志
 
     # 控制台处理器 (INFO level)
-    console_handler = logging.StreamHandler(sys.stdout)
+    # 终端上每行立即显示；重定向时改用块缓冲，减少 write 调用 (logging.shutdown 退出时会刷新剩余内容)
+    console_handler = logging.StreamHandler(sys.stdout) if sys.stdout.isatty() else BlockBufferedStreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO) # 控制台只显示 INFO 及以上级别
     console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
     console_handler.setFormatter(console_formatter)
@@ -115,26 +189,66 @@ def get_logger():
              return temp_logger
     return _logger
 
+# 尚未写入磁盘的目录日志行：日志文件路径 -> 待追加的行列表 (主线程和日志监听线程都会写入，需加锁)
+_pending_dir_lines = {}
+# 每个目录日志中最早一行未写入内容的缓存时间 (time.monotonic())
+_pending_dir_since = {}
+_pending_dir_lock = threading.Lock()
+# 最近一次格式化的目录日志时间戳：(整秒时间, 格式化后的字符串)；同一秒内的日志行直接复用
+_dir_log_timestamp = (0, '')
+
 def log_to_directory(logger, directory_path, log_file_name_template, level_str, formatted_message):
     """
     将已格式化的日志信息追加写入指定目录下的特定日志文件。
     由主进程调用，接收格式化后的消息。
+    日志行先缓存在内存中：同一日志文件累积到 config.DIR_LOG_FLUSH_EVERY 行、最早的一行已缓存超过
+    config.DIR_LOG_FLUSH_INTERVAL 秒，或者遇到 ERROR/CRITICAL 级别时一次性追加写入；其余在 flush_directory_logs 或程序退出时写入。
     """
+    log_level_str_upper = level_str.upper()
+    # 低于 config.DIR_LOG_LEVEL 的消息直接丢弃，不做时间戳格式化和缓冲
+    if getattr(logging, log_level_str_upper, logging.INFO) < getattr(logging, config.DIR_LOG_LEVEL.upper(), logging.INFO):
+        return
     if not directory_path: # 确保目录不为空
         if logger: logger.warning(f"Directory path is empty for directory log: {formatted_message}")
         return # 无法写入日志
 
+    global _dir_log_timestamp
     log_file = os.path.join(directory_path, log_file_name_template)
-    try:
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-        # 确保目录存在
-        os.makedirs(directory_path, exist_ok=True)
+    now = int(time.time())
+    cached_second, timestamp = _dir_log_timestamp
+    if now != cached_second:
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))
+        _dir_log_timestamp = (now, timestamp) # 整体替换元组，多个线程同时更新也不会读到不一致的值
+    with _pending_dir_lock:
+        pending = _pending_dir_lines.setdefault(log_file, [])
+        if not pending:
+            _pending_dir_since[log_file] = time.monotonic()
+        # 时间戳、级别和已格式化的消息
+        pending.append(f"{timestamp} - {log_level_str_upper} - {formatted_message}\n")
+        if (len(pending) < config.DIR_LOG_FLUSH_EVERY
+                and time.monotonic() - _pending_dir_since[log_file] < config.DIR_LOG_FLUSH_INTERVAL
+                and log_level_str_upper not in ('ERROR', 'CRITICAL')):
+            return
+        lines = _pending_dir_lines.pop(log_file)
+        _pending_dir_since.pop(log_file, None)
+    _write_directory_log(logger, log_file, lines)
 
-        log_level_str_upper = level_str.upper()
+def flush_directory_logs(logger=None):
+    """把所有缓存的目录日志行写入各自的日志文件"""
+    with _pending_dir_lock:
+        pending_items = list(_pending_dir_lines.items())
+        _pending_dir_lines.clear()
+        _pending_dir_since.clear()
+    for log_file, lines in pending_items:
+        _write_directory_log(logger, log_file, lines)
 
+def _write_directory_log(logger, log_file, lines):
+    """一次性把若干日志行追加到目录日志文件，失败时记录到全局日志"""
+    try:
+        # 确保目录存在
+        ensure_dir(os.path.dirname(log_file))
         with open(log_file, 'a', encoding='utf-8') as f:
-            # 写入时间戳、级别和已格式化的消息
-            f.write(f"{timestamp} - {log_level_str_upper} - {formatted_message}\n")
+            f.write(''.join(lines))
     except Exception as e:
         # 如果写入目录日志失败，记录到全局日志
         if logger:
@@ -147,4 +261,7 @@ def log_to_directory(logger, directory_path, log_file_name_template, level_str,
                   logger.error(f"Failed to write to directory log {log_file}: {e}. Also failed to get text: {ge}")
         else:
              # Fallback if global logger is not available
-             print(f"Error writing to directory log {log_file}: {e}", file=sys.stderr)
\ No newline at end of file
+             print(f"Error writing to directory log {log_file}: {e}", file=sys.stderr)
+
+# 程序退出 (包括异常退出) 时写入剩余的目录日志
+atexit.register(flush_directory_logs)
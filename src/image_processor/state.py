@@ -2,22 +2,29 @@
 # -- coding: utf-8 --
 
 import os
+import time
+import atexit
 import logging
 import sys # 添加 sys 导入，以便在 logger 不可用时打印到 stderr
-from .utils import get_text # 导入 get_text
+from .utils import get_text, ensure_dir # 导入 get_text
+from . import config
 
 def load_processed_files_from_dir(logger, state_file_path):
     """从指定目录的状态文件中加载已处理的文件名集合"""
     processed = set()
     if os.path.exists(state_file_path):
         try:
-            # 使用 'utf-8-sig' 来处理可能存在的 BOM (Byte Order Mark)
-            with open(state_file_path, 'r', encoding='utf-8-sig') as f:
-                for line in f:
-                    cleaned_line = line.strip()
-                    if cleaned_line: # 确保只添加非空行
-                        processed.add(cleaned_line)
-            if logger:
+            # 一次读入整个文件再拆分，避免逐行解码
+            with open(state_file_path, 'rb') as f:
+                data = f.read()
+            # 手动去掉可能存在的 BOM (Byte Order Mark)，其余部分用更快的普通 utf-8 解码
+            if data.startswith(b'\xef\xbb\xbf'):
+                data = data[3:]
+            data = data.decode('utf-8')
+            # 记录按原样写入，每行就是完整文件名：只去掉换行符 (含 Windows 的 '\r')，不再 strip 首尾空格
+            processed = set(data.replace('\r', '').split('\n'))
+            processed.discard('') # 确保只保留非空行
+            if logger and logger.isEnabledFor(logging.DEBUG):
                 # 使用 get_text 获取日志消息 (假设 logger 存在时 get_text 可用)
                 try:
                     log_msg = get_text("log_load_state_success", path=state_file_path, count=len(processed))
@@ -37,12 +44,16 @@ def load_processed_files_from_dir(logger, state_file_path):
                 print(f"Error loading state file {state_file_path}: {e}", file=sys.stderr)
     return processed
 
-# 修改：添加 lock 参数，logger 变为可选
-def save_processed_file_to_dir(logger, state_file_path, original_file_name, lock=None):
+# 尚未写入磁盘的记录：状态文件路径 -> 待追加的文件名列表 (只在主进程中使用)
+_pending_records = {}
+# 每个状态文件中最早一条未写入记录的缓存时间 (time.monotonic())
+_pending_since = {}
+
+def save_processed_file_to_dir(logger, state_file_path, original_file_name):
     """
-    将已处理的文件名追加到指定目录的状态文件中。
-    使用锁来确保并发写入安全。
-    logger 参数变为可选，因为子进程不直接记录错误。
+    记录已处理的文件名，先缓存在内存中。
+    同一状态文件累积到 config.STATE_FLUSH_EVERY 条、或最早的记录已缓存超过 config.STATE_FLUSH_INTERVAL 秒时一次性追加写入；
+    其余记录由调用者在目录处理完毕时通过 flush_processed 写入，程序退出时也会自动写入。
     """
     if not original_file_name: # 防止写入空行
         if logger:
@@ -54,36 +65,42 @@ def save_processed_file_to_dir(logger, state_file_path, original_file_name, lock
                  logger.warning(f"Attempted to save empty filename to state file {state_file_path}. Text error: {text_err}")
         return
 
-    try:
-        # 确保状态文件所在的目录存在
-        dir_name = os.path.dirname(state_file_path)
-        if dir_name: # 确保目录名不为空（例如在根目录下）
-             os.makedirs(dir_name, exist_ok=True)
-
-        # 如果提供了锁，则在写入前获取锁
-        if lock:
-            lock.acquire()
+    pending = _pending_records.setdefault(state_file_path, [])
+    if not pending:
+        _pending_since[state_file_path] = time.monotonic()
+    pending.append(original_file_name)
+    if len(pending) >= config.STATE_FLUSH_EVERY or time.monotonic() - _pending_since[state_file_path] >= config.STATE_FLUSH_INTERVAL:
+        flush_processed(logger, state_file_path)
 
+def flush_processed(logger, state_file_path=None):
+    """
+    把缓存的记录一次性追加到状态文件。state_file_path 为 None 时写入所有状态文件。
+    写入失败时记录错误，这些记录会被丢弃 (对应文件下次运行时会被重新处理)。
+    """
+    paths = list(_pending_records) if state_file_path is None else [state_file_path]
+    for path in paths:
+        pending = _pending_records.pop(path, None)
+        _pending_since.pop(path, None)
+        if not pending:
+            continue
         try:
-            with open(state_file_path, 'a', encoding='utf-8') as f:
-                f.write(original_file_name + '\n')
-        finally:
-            # 确保在任何情况下都释放锁
-            if lock:
-                lock.release()
+            # 确保状态文件所在的目录存在
+            dir_name = os.path.dirname(path)
+            if dir_name: # 确保目录名不为空（例如在根目录下）
+                 ensure_dir(dir_name)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(pending) + '\n')
+        except Exception as e:
+            if logger:
+                # 使用 get_text 获取日志消息
+                try:
+                    err_msg = get_text("log_flush_state_fail", path=path, count=len(pending), error=e)
+                    logger.error(err_msg)
+                except Exception as text_err:
+                    logger.error(f"Failed to get text for log_flush_state_fail: {text_err}. Original error writing {len(pending)} records to {path}: {e}")
+            else:
+                # Fallback if logger is not available
+                print(f"Error writing {len(pending)} records to state file {path}: {e}", file=sys.stderr)
 
-    except Exception as e:
-        # 子进程不方便记录日志，依赖主进程通过返回值捕获问题
-        # 但如果 logger 存在（例如在主进程中直接调用），则记录错误
-        if logger:
-            # 使用 get_text 获取日志消息
-            try:
-                err_msg = get_text("log_save_state_fail", path=state_file_path, filename=original_file_name, error=e)
-                logger.error(err_msg)
-            except Exception as text_err:
-                logger.error(f"Failed to get text for log_save_state_fail: {text_err}. Original error saving state for {original_file_name} to {state_file_path}: {e}")
-        else:
-            # Fallback if logger is not available during direct call
-            print(f"Error saving state to {state_file_path} for {original_file_name}: {e}", file=sys.stderr)
-        # 抛出异常，以便调用者（如 core 函数）知道状态保存失败
-        raise
\ No newline at end of file
+# 程序退出 (包括异常退出) 时写入剩余的记录
+atexit.register(flush_processed, None)
@@ -1,158 +1,132 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
-import multiprocessing
+import functools
 from . import config # 相对导入配置
 from .utils import get_text # 相对导入 get_text
 
+def _exit_on_interrupt(prompt_func):
+    """交互函数的统一中断处理：输入结束 (EOF) 或按 Ctrl+C 时提示用户中断并退出程序"""
+    @functools.wraps(prompt_func)
+    def wrapper(*args, **kwargs):
+        try:
+            return prompt_func(*args, **kwargs)
+        except (EOFError, KeyboardInterrupt):
+            # 语言尚未选择时 get_text 使用默认语言 (中文)
+            print(f"\n{get_text('user_interrupt')}", file=sys.stderr)
+            sys.exit(1) # 用户中断，退出程序
+    return wrapper
+
+@_exit_on_interrupt
 def select_language():
     """提示用户选择语言, Enter 使用默认值 (中文)。返回选择的语言代码 ('zh' 或 'en')"""
     default_lang_code = 'zh' # 默认中文
+    # 初始提示固定用中文格式显示选项和默认值
+    prompt = config.texts['zh']['select_language']
     while True:
-        # 初始提示固定用中文格式显示选项和默认值
-        prompt = config.texts['zh']['select_language']
-        try:
-            choice = input(prompt).strip()
-            if choice == '1':
-                print(config.texts['zh']["language_selected"]) # 用中文确认
-                return 'zh'
-            elif choice == '2':
-                print(config.texts['en']["language_selected"]) # 用英文确认
-                return 'en'
-            elif choice == '': # Enter 使用默认值
-                print(config.texts[default_lang_code]["language_selected"]) # 用默认语言确认
-                return default_lang_code
-            else:
-                # 无效选择提示也用默认中文显示
-                print(config.texts['zh']["invalid_choice_language"])
-        except (EOFError, KeyboardInterrupt):
-             # 使用 get_text 获取中断提示，但需要先设置默认语言，否则可能出错
-             # 假设此时语言尚未设置，使用默认语言的文本
-             print(f"\n{config.texts[default_lang_code]['user_interrupt']}", file=sys.stderr)
-             sys.exit(1) # 用户中断，退出程序
+        choice = input(prompt).strip()
+        if choice == '1':
+            print(config.texts['zh']["language_selected"]) # 用中文确认
+            return 'zh'
+        elif choice == '2':
+            print(config.texts['en']["language_selected"]) # 用英文确认
+            return 'en'
+        elif choice == '': # Enter 使用默认值
+            print(config.texts[default_lang_code]["language_selected"]) # 用默认语言确认
+            return default_lang_code
+        else:
+            # 无效选择提示也用默认中文显示
+            print(config.texts['zh']["invalid_choice_language"])
 
+@_exit_on_interrupt
 def get_processing_mode():
     """交互式获取用户处理模式, Enter 使用默认值 (WebP)。返回模式标识符 ('inplace' 或 'webp')"""
     default_mode_code = 'webp'
     mode_map = {'1': 'inplace', '2': 'webp'}
+    # 使用 get_text 获取当前语言的提示
+    prompt = get_text("select_mode")
+    while True:
+        choice = input(prompt).strip().lower()
+        if choice in mode_map:
+            return mode_map[choice]
+        elif choice == '': # Enter 使用默认值
+            return default_mode_code
+        else:
+            print(get_text("invalid_choice_mode")) # 使用当前语言提示无效
+
+def _prompt_int(prompt_key, default, lo, hi, err_key):
+    """反复提示直到输入 lo~hi 之间的整数, Enter 使用默认值。返回输入的整数"""
+    # 提示和错误文本只取一次，重试时直接复用
+    prompt = get_text(prompt_key, default=default)
+    range_error = get_text(err_key)
+    number_error = get_text("error_invalid_number")
     while True:
-        # 使用 get_text 获取当前语言的提示
-        prompt = get_text("select_mode")
         try:
-            choice = input(prompt).strip().lower()
-            if choice in mode_map:
-                return mode_map[choice]
-            elif choice == '': # Enter 使用默认值
-                return default_mode_code
-            else:
-                print(get_text("invalid_choice_mode")) # 使用当前语言提示无效
-        except (EOFError, KeyboardInterrupt):
-             print(f"\n{get_text('user_interrupt')}", file=sys.stderr) # 使用当前语言提示中断
-             sys.exit(1)
+            value_input = input(prompt).strip()
+            value = int(value_input) if value_input else default
+            if lo <= value <= hi:
+                return value
+            print(range_error)
+        except ValueError:
+            print(number_error)
+
+def _prompt_yn(prompt_key, default):
+    """反复提示直到输入 y/n, Enter 使用默认值。返回布尔值"""
+    prompt = get_text(prompt_key, default='y' if default else 'n')
+    yn_error = get_text("error_invalid_yn")
+    answers = {'y': True, 'n': False, '': default}
+    while True:
+        answer = input(prompt).lower().strip()
+        if answer in answers:
+            return answers[answer]
+        print(yn_error)
 
+@_exit_on_interrupt
 def get_inplace_parameters():
     """交互式获取原格式压缩模式参数。返回包含参数的字典。"""
     params = {}
     # 获取 JPEG 质量
-    while True:
-        try:
-            prompt = get_text("prompt_jpeg_quality", default=config.INPLACE_DEFAULT_COMPRESSION_QUALITY)
-            quality_input = input(prompt).strip()
-            quality = int(quality_input) if quality_input else config.INPLACE_DEFAULT_COMPRESSION_QUALITY
-            if 1 <= quality <= 95:
-                params['quality'] = quality
-                break
-            else:
-                print(get_text("error_invalid_quality_jpeg"))
-        except ValueError:
-            print(get_text("error_invalid_number"))
-        except (EOFError, KeyboardInterrupt):
-             print(f"\n{get_text('user_interrupt')}", file=sys.stderr)
-             sys.exit(1)
-
+    params['quality'] = _prompt_int("prompt_jpeg_quality", config.INPLACE_DEFAULT_COMPRESSION_QUALITY, 1, 95, "error_invalid_quality_jpeg")
     # 获取 PNG 优化选项
-    while True:
-        try:
-            default_optimize_char = 'y' if config.INPLACE_DEFAULT_PNG_OPTIMIZE else 'n'
-            prompt = get_text("prompt_png_optimize", default=default_optimize_char)
-            optimize_input = input(prompt).lower().strip()
-            if optimize_input == 'y':
-                params['png_optimize'] = True
-                break
-            elif optimize_input == 'n':
-                params['png_optimize'] = False
-                break
-            elif optimize_input == '': # Enter 使用默认值
-                params['png_optimize'] = config.INPLACE_DEFAULT_PNG_OPTIMIZE
-                break
-            else:
-                print(get_text("error_invalid_yn"))
-        except (EOFError, KeyboardInterrupt):
-             print(f"\n{get_text('user_interrupt')}", file=sys.stderr)
-             sys.exit(1)
+    params['png_optimize'] = _prompt_yn("prompt_png_optimize", config.INPLACE_DEFAULT_PNG_OPTIMIZE)
     return params
 
+@_exit_on_interrupt
 def get_webp_parameters():
     """交互式获取 WebP 模式参数。返回包含参数的字典。"""
     params = {}
     # 获取 WebP 质量
-    while True:
-        try:
-            prompt = get_text("prompt_webp_quality", default=config.WEBP_DEFAULT_QUALITY)
-            quality_input = input(prompt).strip()
-            quality = int(quality_input) if quality_input else config.WEBP_DEFAULT_QUALITY
-            if 0 <= quality <= 100:
-                params['webp_quality'] = quality
-                break
-            else:
-                print(get_text("error_invalid_quality_webp"))
-        except ValueError:
-            print(get_text("error_invalid_number"))
-        except (EOFError, KeyboardInterrupt):
-             print(f"\n{get_text('user_interrupt')}", file=sys.stderr)
-             sys.exit(1)
-
+    params['webp_quality'] = _prompt_int("prompt_webp_quality", config.WEBP_DEFAULT_QUALITY, 0, 100, "error_invalid_quality_webp")
     # 获取 WebP 无损选项
-    while True:
-        try:
-            default_lossless_char = 'y' if config.WEBP_DEFAULT_LOSSLESS else 'n'
-            prompt = get_text("prompt_webp_lossless", default=default_lossless_char)
-            lossless_input = input(prompt).lower().strip()
-            if lossless_input == 'y':
-                params['webp_lossless'] = True
-                break
-            elif lossless_input == 'n':
-                params['webp_lossless'] = False
-                break
-            elif lossless_input == '': # Enter 使用默认值
-                params['webp_lossless'] = config.WEBP_DEFAULT_LOSSLESS
-                break
-            else:
-                print(get_text("error_invalid_yn"))
-        except (EOFError, KeyboardInterrupt):
-             print(f"\n{get_text('user_interrupt')}", file=sys.stderr)
-             sys.exit(1)
+    params['webp_lossless'] = _prompt_yn("prompt_webp_lossless", config.WEBP_DEFAULT_LOSSLESS)
     return params
 
+@_exit_on_interrupt
 def get_num_workers():
     """交互式获取用户希望使用的并发工作进程数。返回进程数。"""
     suggested_workers = config.DEFAULT_WORKERS
     fallback_workers = 4 # 如果无法检测核心数，使用的备用值
 
-    print(get_text("calculating_workers")) # 使用 get_text
+    # 提示前的几行信息先收集起来，在 input() 之前一次写出
+    info_lines = [get_text("calculating_workers")]
     try:
-        cpu_cores = os.cpu_count()
+        # 优先按当前进程可用的 CPU 计数 (容器或 taskset 限制了 CPU 时 os.cpu_count() 会偏大)
+        try:
+            cpu_cores = len(os.sched_getaffinity(0))
+        except AttributeError: # 非 Linux 平台没有 sched_getaffinity
+            cpu_cores = os.cpu_count()
         if cpu_cores:
             # 建议使用核心数-1，最少为1
             suggested_workers = max(1, cpu_cores - 1)
-            print(get_text("detected_cores", cpu_cores=cpu_cores)) # 使用 get_text
-            print(get_text("suggested_workers", workers=suggested_workers)) # 使用 get_text
+            info_lines.append(get_text("detected_cores", cpu_cores=cpu_cores))
+            info_lines.append(get_text("suggested_workers", workers=suggested_workers))
         else:
             suggested_workers = fallback_workers # 使用备用值
-            print(get_text("error_cpu_count", fallback=fallback_workers)) # 使用 get_text
+            info_lines.append(get_text("error_cpu_count", fallback=fallback_workers))
     except NotImplementedError:
          suggested_workers = fallback_workers # 使用备用值
-         print(get_text("error_cpu_count_unsupported", fallback=fallback_workers)) # 使用 get_text
+         info_lines.append(get_text("error_cpu_count_unsupported", fallback=fallback_workers))
+    print('\n'.join(info_lines))
 
     while True:
         try:
@@ -172,9 +146,6 @@ def get_num_workers():
                     print(get_text("error_invalid_worker_count")) # 输入了负数
         except ValueError:
             print(get_text("error_invalid_number")) # 输入的不是数字
-        except (EOFError, KeyboardInterrupt):
-             print(f"\n{get_text('user_interrupt')}", file=sys.stderr)
-             sys.exit(1)
 
     print(get_text("using_workers", workers=num_workers)) # 使用 get_text 确认最终值
     return num_workers
\ No newline at end of file
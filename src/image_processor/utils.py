@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import os
 import sys
+import threading
+from functools import lru_cache
 from . import config # 使用相对导入
 
 # --- 模块级变量存储选择的语言 ---
@@ -15,10 +18,15 @@ def set_language(lang_code):
         print(f"Warning: Invalid language code '{lang_code}' provided. Using default '{_selected_language}'.", file=sys.stderr)
         # 不改变 _selected_language，保持默认值
 
+@lru_cache(maxsize=256)
+def _get_template(lang_code, key):
+    """查找并缓存文本模板 (只缓存模板，格式化在缓存之外进行)"""
+    return config.texts[lang_code].get(key, f"MISSING_TEXT[{key}]")
+
 def get_text(key, **kwargs):
     """根据已设置的语言获取文本，并支持格式化"""
     # 使用模块级的 _selected_language
-    text_template = config.texts[_selected_language].get(key, f"MISSING_TEXT[{key}]")
+    text_template = _get_template(_selected_language, key)
     try:
         return text_template.format(**kwargs)
     except KeyError as e:
@@ -31,4 +39,16 @@ def get_text(key, **kwargs):
          # 尝试使用默认语言获取格式化错误消息
         warning_msg = f"Warning: Error formatting text '{key}' in language '{_selected_language}': {e}"
         print(warning_msg, file=sys.stderr)
-        return text_template + " (Format Error)"
\ No newline at end of file
+        return text_template + " (Format Error)"
+
+# --- 已确认存在的目录，避免每次写日志/状态文件都调用一次 makedirs ---
+_ensured_dirs = set()
+_ensured_dirs_lock = threading.Lock()
+
+def ensure_dir(dir_path):
+    """确保目录存在 (同 os.makedirs(exist_ok=True))；同一进程内已确认过的目录直接返回。创建失败时抛出 OSError"""
+    if dir_path in _ensured_dirs:
+        return
+    os.makedirs(dir_path, exist_ok=True)
+    with _ensured_dirs_lock:
+        _ensured_dirs.add(dir_path)
@@ -2,14 +2,17 @@
 # -- coding: utf-8 --
 
 import os
+import re
+import stat
+import fnmatch
 import sys
 import argparse
+import signal
 import time
 import logging
+import logging.handlers
 import multiprocessing
-from multiprocessing.managers import BaseManager
-from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 # --- 动态调整 sys.path ---
 # 假设 main.py 在 src 目录下，项目根目录是 src 的父目录
@@ -20,110 +23,152 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 # 如果你的结构不同（例如 main.py 在项目根目录），请调整这里
 
+def _report_import_error(e):
+    """打印包模块导入失败的提示 (此时多语言可能未设置，使用英文)"""
+    print(f"Error importing package modules: {e}", file=sys.stderr)
+    print("Ensure the script is run from the correct directory (e.g., the 'src' folder or project root)", file=sys.stderr)
+    print(f"Current sys.path: {sys.path}", file=sys.stderr)
+
 # --- 导入包模块 ---
+# 这里只导入参数解析需要的轻量模块；处理相关的模块 (会导入 Pillow 和可选的编解码库) 由 _import_processing_modules 在参数校验通过后导入
 try:
-    from image_processor import config, utils, log_utils, state, core, ui
+    from image_processor import config, utils
 except ImportError as e:
-     # 尝试获取英文错误信息，因为此时多语言可能未设置
-     print(f"Error importing package modules: {e}", file=sys.stderr)
-     print("Ensure the script is run from the correct directory (e.g., the 'src' folder or project root)", file=sys.stderr)
-     print(f"Current sys.path: {sys.path}", file=sys.stderr)
+     _report_import_error(e)
      sys.exit(1)
+log_utils = state = core = ui = backends = None
+
+def _import_processing_modules():
+    """导入处理流程使用的包模块；--help 和路径错误时不必等待 Pillow、numpy 等库的导入"""
+    global log_utils, state, core, ui, backends
+    try:
+        from image_processor import log_utils, state, core, ui, backends
+    except ImportError as e:
+        _report_import_error(e)
+        sys.exit(1)
+
+# --- 扫描时使用的常量 ---
+_SUPPORTED_EXTENSIONS = frozenset(config.SUPPORTED_EXTENSIONS)
+# 两种模式的状态/日志文件以及临时文件都不参与处理
+_SKIP_FILENAMES = frozenset({config.INPLACE_DIR_LOG_FILE_NAME, config.INPLACE_DIR_STATE_FILE_NAME,
+                             config.WEBP_DIR_LOG_FILE_NAME, config.WEBP_DIR_STATE_FILE_NAME})
+_TEMP_SUFFIXES = (".compress_temp", ".webp_temp")
+# 日志消息中的 [[key]] 占位符
+_PLACEHOLDER_RE = re.compile(r'\[\[(.*?)\]\]')
+
+# 日志条目中的级别名 -> logging 级别 (工作进程使用小写级别名)
+_LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING,
+           'error': logging.ERROR, 'critical': logging.CRITICAL}
 
 # --- 辅助函数：处理子进程返回的日志 ---
+def _format_simple(logger, get_text_func, level_str, message_key, kwargs):
+    """把日志消息作为文本 key 翻译并格式化；不是 key 时作为普通字符串格式化，或原样记录"""
+    try:
+        # 优先尝试作为 key 获取翻译和格式化
+        return get_text_func(message_key, **kwargs)
+    except KeyError:
+        pass
+    except Exception as text_err:
+        # get_text 本身出错
+        formatted_message = f"LOG PROCESSING ERROR [{level_str}]: {message_key} | {kwargs} | Error: {text_err}"
+        logger.error(formatted_message) # 记录处理错误
+        return formatted_message
+    # 如果不是 key，尝试直接格式化（如果是字符串且含占位符）
+    if isinstance(message_key, str) and '{' in message_key:
+        try:
+            return message_key.format(**kwargs)
+        except Exception as fmt_e:
+            formatted_message = f"RAW LOG FORMAT ERROR [{level_str}]: {message_key} | {kwargs} | {fmt_e}"
+            logger.warning(formatted_message) # 记录格式化错误
+            return formatted_message
+    # 既不是 key 也不是可格式化字符串，作为原始信息记录
+    return f"RAW LOG [{level_str}]: {message_key} | {kwargs}"
+
+def _format_with_placeholder(logger, get_text_func, level_str, message, kwargs):
+    """
+    先把消息中的 [[key]] 占位符替换为对应的文本，再格式化整个消息。
+    消息中没有 [[key]] 时返回空字符串，由调用者按 _format_simple 处理。
+    """
+    placeholder = _PLACEHOLDER_RE.search(message)
+    if not placeholder:
+        return ""
+    text_key = placeholder.group(1)
+    try:
+        replacement_text = get_text_func(text_key)
+    except KeyError:
+        # get_text_func 找不到占位符 key，带着缺失提示格式化
+        temp_message = message.replace(f'[[{text_key}]]', f'[MissingKey:{text_key}]')
+        logger.warning(f"Missing text key '{text_key}' used in placeholder: {message}")
+        try:
+            return temp_message.format(**kwargs)
+        except Exception as fmt_e:
+            formatted_message = f"RAW LOG FORMAT ERROR (Missing Placeholder Key) [{level_str}]: {temp_message} | {kwargs} | {fmt_e}"
+            logger.warning(formatted_message) # 记录格式化错误
+            return formatted_message
+    temp_message = message.replace(f'[[{text_key}]]', replacement_text)
+    try:
+        # 替换后的结果可能本身就是一个 key
+        return get_text_func(temp_message, **kwargs)
+    except KeyError:
+        pass
+    # 不是 key，直接格式化包含替换文本的字符串
+    try:
+        return temp_message.format(**kwargs)
+    except Exception as fmt_e:
+        formatted_message = f"RAW LOG FORMAT ERROR (Placeholder) [{level_str}]: {temp_message} | {kwargs} | {fmt_e}"
+        logger.warning(formatted_message) # 记录格式化错误
+        return formatted_message
+
 def log_processor_messages(logger, get_text_func, dir_log_file_name_template, messages):
     """处理从子进程返回的日志消息列表"""
     if not messages:
         return
 
+    dir_log_level = getattr(logging, config.DIR_LOG_LEVEL.upper(), logging.INFO)
+    # 同一批消息通常来自同一个文件，文件名前缀只在路径变化时重新计算
+    last_path = None
+    last_path_prefix = ""
     for log_entry in messages:
         try:
             # 解包日志条目，现在包含 context_kwargs
             level_str, message_key_or_raw, kwargs, to_dir_log, *context_kwargs_list = log_entry
             context_kwargs = context_kwargs_list[0] if context_kwargs_list else {}
 
-            level = getattr(logging, level_str.upper(), logging.INFO)
+            level = _LEVELS.get(level_str) or getattr(logging, level_str.upper(), logging.INFO)
+            # 全局 logger 和目录日志 (低于 config.DIR_LOG_LEVEL 时不写) 都不会记录时，跳过翻译和格式化
+            log_global = logger.isEnabledFor(level)
+            to_dir_log = to_dir_log and level >= dir_log_level
+            if not log_global and not to_dir_log:
+                continue
 
-            # 处理特殊的占位符 [[key]]
-            processed_message_key = message_key_or_raw
-            formatted_message = "" # 初始化为空字符串
+            # 参数值中的 [[key]] 占位符 (例如 WebP 的有损/无损模式名) 替换为当前语言的文本，一个值中可以有多个
+            if any(isinstance(value, str) and '[[' in value for value in kwargs.values()):
+                kwargs = {name: _PLACEHOLDER_RE.sub(lambda m: get_text_func(m.group(1)), value) if isinstance(value, str) else value
+                          for name, value in kwargs.items()}
 
+            # 只有含 [[key]] 占位符的消息走占位符替换，其余直接按 key 翻译格式化
+            formatted_message = ""
             if isinstance(message_key_or_raw, str) and '[[' in message_key_or_raw:
-                import re
-                placeholder = re.search(r'\[\[(.*?)\]\]', message_key_or_raw)
-                if placeholder:
-                    text_key = placeholder.group(1)
-                    try:
-                        replacement_text = get_text_func(text_key)
-                        # 使用 get_text 格式化包含占位符的整个消息
-                        # 需要确保 kwargs 包含占位符 key 对应的值（如果需要的话）
-                        # 或者，如果占位符只是简单的文本替换
-                        temp_message = message_key_or_raw.replace(f'[[{text_key}]]', replacement_text)
-                        # 再用 get_text 格式化替换后的字符串（如果它本身也是一个 key）
-                        # 或者直接格式化包含替换文本的字符串
-                        try:
-                            # 尝试将替换后的结果作为 key 查找
-                            formatted_message = get_text_func(temp_message, **kwargs)
-                        except KeyError:
-                            # 如果替换后的不是 key，尝试直接格式化
-                            try:
-                                formatted_message = temp_message.format(**kwargs)
-                            except Exception as fmt_e:
-                                formatted_message = f"RAW LOG FORMAT ERROR (Placeholder) [{level_str}]: {temp_message} | {kwargs} | {fmt_e}"
-                                logger.warning(formatted_message) # 记录格式化错误
-                    except KeyError:
-                         # get_text_func 找不到占位符 key
-                         missing_key_text = f'[MissingKey:{text_key}]'
-                         temp_message = message_key_or_raw.replace(f'[[{text_key}]]', missing_key_text)
-                         logger.warning(f"Missing text key '{text_key}' used in placeholder: {message_key_or_raw}")
-                         # 尝试格式化带有缺失 key 提示的字符串
-                         try:
-                             formatted_message = temp_message.format(**kwargs)
-                         except Exception as fmt_e:
-                             formatted_message = f"RAW LOG FORMAT ERROR (Missing Placeholder Key) [{level_str}]: {temp_message} | {kwargs} | {fmt_e}"
-                             logger.warning(formatted_message) # 记录格式化错误
-                else:
-                     # 没有找到 [[key]] 格式，按普通流程处理
-                     processed_message_key = message_key_or_raw
-            else:
-                 processed_message_key = message_key_or_raw
-
-            # 如果经过占位符处理后 formatted_message 仍为空，则按原逻辑处理
+                formatted_message = _format_with_placeholder(logger, get_text_func, level_str, message_key_or_raw, kwargs)
             if not formatted_message:
-                try:
-                    # 优先尝试作为 key 获取翻译和格式化
-                    formatted_message = get_text_func(processed_message_key, **kwargs)
-                except KeyError:
-                    # 如果不是 key，尝试直接格式化（如果是字符串且含占位符）
-                    if isinstance(processed_message_key, str) and '{' in processed_message_key:
-                        try:
-                            formatted_message = processed_message_key.format(**kwargs)
-                        except Exception as fmt_e:
-                            formatted_message = f"RAW LOG FORMAT ERROR [{level_str}]: {processed_message_key} | {kwargs} | {fmt_e}"
-                            logger.warning(formatted_message) # 记录格式化错误
-                    else:
-                        # 既不是 key 也不是可格式化字符串，作为原始信息记录
-                        formatted_message = f"RAW LOG [{level_str}]: {processed_message_key} | {kwargs}"
-                except Exception as text_err:
-                     # get_text 本身出错
-                     formatted_message = f"LOG PROCESSING ERROR [{level_str}]: {processed_message_key} | {kwargs} | Error: {text_err}"
-                     logger.error(formatted_message) # 记录处理错误
-
-            # 记录到全局 logger (添加文件名前缀)
-            log_prefix = ""
-            # 尝试从 context 或 kwargs 获取路径信息
-            file_path_context = context_kwargs.get('path') or kwargs.get('path')
-            original_filename_context = result.get('original_filename') if 'result' in locals() else None # core 返回结果中可能有
-            filename_kwarg = kwargs.get('filename')
-
-            if file_path_context:
-                 log_prefix = f"[{os.path.basename(file_path_context)}] "
-            elif original_filename_context:
-                 log_prefix = f"[{original_filename_context}] "
-            elif filename_kwarg:
-                 log_prefix = f"[{filename_kwarg}] "
-
-            logger.log(level, f"{log_prefix}{formatted_message}")
+                formatted_message = _format_simple(logger, get_text_func, level_str, message_key_or_raw, kwargs)
+
+            # 记录到全局 logger (添加文件名前缀)；只写目录日志的消息不必构建前缀
+            if log_global:
+                log_prefix = ""
+                # 尝试从 context 或 kwargs 获取路径信息
+                file_path_context = context_kwargs.get('path') or kwargs.get('path')
+                filename_kwarg = kwargs.get('filename')
+
+                if file_path_context:
+                     if file_path_context != last_path:
+                         last_path = file_path_context
+                         last_path_prefix = f"[{os.path.basename(file_path_context)}] "
+                     log_prefix = last_path_prefix
+                elif filename_kwarg:
+                     log_prefix = f"[{filename_kwarg}] "
+
+                logger.log(level, f"{log_prefix}{formatted_message}")
 
             # 如果需要，记录到目录日志
             if to_dir_log:
@@ -139,6 +184,131 @@ def log_processor_messages(logger, get_text_func, dir_log_file_name_template, me
             logger.error(f"Error processing log entry: {log_entry}. Error: {log_proc_err}", exc_info=True)
 
 
+class WorkerLogListener(logging.handlers.QueueListener):
+    """在主进程的后台线程中处理工作进程经队列发来的 log_messages 列表，结果循环无需等待日志格式化与写盘"""
+
+    def __init__(self, queue, logger, get_text_func, dir_log_file_name_template):
+        super().__init__(queue)
+        self.logger = logger
+        self.get_text_func = get_text_func
+        self.dir_log_file_name_template = dir_log_file_name_template
+
+    def handle(self, messages):
+        try:
+            log_processor_messages(self.logger, self.get_text_func, self.dir_log_file_name_template, messages)
+        except Exception as log_proc_err:
+            # 不让单批消息的错误终止后台线程
+            self.logger.error(f"Error processing worker log messages: {log_proc_err}", exc_info=True)
+
+
+def _image_ext(file_name):
+    """返回需要处理的图片文件的小写扩展名；元数据文件、临时文件和不支持的格式返回 None"""
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext in _SUPPORTED_EXTENSIONS and file_name not in _SKIP_FILENAMES and not file_name.endswith(_TEMP_SUFFIXES):
+        return ext
+    return None
+
+
+def _webp_target_conflicts(entries, image_files, processed_set):
+    """
+    WebP 模式下返回本目录中不能转换的文件名集合：多个待转换文件会写成同一个 .webp (如 a.jpg 与 a.png)，
+    或同名的 .webp 已经存在。转换成功后会删除原图，这两种情况都会丢失图片。
+    主名按小写比较，以免在不区分大小写的文件系统上互相覆盖。
+    """
+    existing_webp = set()
+    for entry in entries:
+        base_name, ext = os.path.splitext(entry.name)
+        if ext.lower() == '.webp':
+            existing_webp.add(base_name.lower())
+    names_by_stem = {}
+    for entry, ext in image_files:
+        if entry.name in processed_set:
+            continue
+        names_by_stem.setdefault(os.path.splitext(entry.name)[0].lower(), []).append(entry.name)
+    conflicts = set()
+    for stem, names in names_by_stem.items():
+        if len(names) > 1 or stem in existing_webp:
+            conflicts.update(names)
+    return conflicts
+
+
+def _scan_dir(dir_path, ignore_dir_patterns, stat_filter=None, dir_loader=None):
+    """
+    读取单个目录，返回 (非目录条目列表, 需要继续进入的子目录路径列表, dir_loader(dir_path) 的结果)；目录无法读取时返回 None。
+    名称满足 stat_filter 的条目会预先调用一次 entry.stat()，DirEntry 会缓存结果 (出错时留给调用者处理)。
+    """
+    try:
+        with os.scandir(dir_path) as it:
+            entries = list(it)
+    except OSError:
+        return None
+    file_entries = []
+    sub_dirs = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            file_entries.append(entry)
+            if stat_filter is not None and stat_filter(entry.name):
+                try:
+                    entry.stat()
+                except OSError:
+                    pass
+        elif not entry.is_symlink() and not any(fnmatch.fnmatch(entry.name, pattern) for pattern in ignore_dir_patterns):
+            sub_dirs.append(entry.path)
+    return file_entries, sub_dirs, (dir_loader(dir_path) if dir_loader is not None else None)
+
+
+def _iter_dir_entries(root_folder, ignore_dir_patterns=(), threads=1, stat_filter=None, dir_loader=None):
+    """
+    遍历 root_folder 及其子目录，逐个目录返回 (目录路径, 非目录条目的 DirEntry 列表, dir_loader 的结果)。
+    与 os.walk 的规则一致：不进入指向目录的符号链接，无法读取的目录直接跳过。
+    名称匹配 ignore_dir_patterns 中任一通配符 (fnmatch) 的子目录连同其整个子树都不进入。
+    直接返回 DirEntry，调用者可以用 entry.stat() 取得文件信息 (Windows 上来自目录列表本身，无需额外的 stat 调用)。
+    threads 大于 1 时用线程池同时读取多个目录 (readdir/stat 会释放 GIL)，在网络文件系统或冷缓存磁盘上重叠 I/O 等待，
+    此时目录按读取完成的顺序返回；stat_filter 见 _scan_dir，使这些 stat 调用也在扫描线程中完成。
+    dir_loader(目录路径) 用于读取每个目录附带的数据 (例如状态文件)，同样在扫描线程中执行；未提供时结果为 None。
+    """
+    if threads <= 1:
+        pending_dirs = [root_folder]
+        while pending_dirs:
+            dir_path = pending_dirs.pop()
+            scanned = _scan_dir(dir_path, ignore_dir_patterns, stat_filter, dir_loader)
+            if scanned is None:
+                continue
+            file_entries, sub_dirs, dir_data = scanned
+            yield dir_path, file_entries, dir_data
+            # 倒序压栈，使子目录按列表顺序依次处理
+            pending_dirs.extend(reversed(sub_dirs))
+        return
+
+    with ThreadPoolExecutor(max_workers=threads) as scan_pool:
+        pending = {scan_pool.submit(_scan_dir, root_folder, ignore_dir_patterns, stat_filter, dir_loader): root_folder}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dir_path = pending.pop(future)
+                    scanned = future.result()
+                    if scanned is None:
+                        continue
+                    file_entries, sub_dirs, dir_data = scanned
+                    for sub_dir in sub_dirs:
+                        pending[scan_pool.submit(_scan_dir, sub_dir, ignore_dir_patterns, stat_filter, dir_loader)] = sub_dir
+                    yield dir_path, file_entries, dir_data
+        finally:
+            # 调用者提前结束遍历 (例如出错) 时不再读取剩余目录
+            for future in pending:
+                future.cancel()
+
+
+def _exit_on_sigterm(signum, frame):
+    """把 SIGTERM 转换为 SystemExit：main_runner 的 finally 和 atexit 钩子会照常写入缓冲中的状态记录和目录日志"""
+    raise SystemExit(128 + signum)
+
+
 # --- 主程序 ---
 # 修改：移除 num_workers_override 参数
 def main_runner(root_folder):
@@ -209,6 +379,18 @@ def main_runner(root_folder):
     logger.info(get_text("state_file_info", state_file=dir_state_file_name, log_file=dir_log_file_name))
     # 记录使用的进程数
     logger.info(get_text("using_workers", workers=num_workers))
+    # 记录实际生效的编解码库，便于确认 Pillow-SIMD 等替换是否生效
+    logger.info(get_text("codec_backends",
+                         pillow=backends.PIL.__version__,
+                         simd=get_text("backend_yes") if backends.pillow_simd_active() else get_text("backend_no"),
+                         zlib_ng=get_text("backend_yes") if backends.pillow_zlib_ng_active() else get_text("backend_no"),
+                         turbojpeg=get_text("backend_yes") if backends.turbojpeg_available() else get_text("backend_no"),
+                         libdeflate=get_text("backend_yes") if backends.libdeflate_available() else get_text("backend_no"),
+                         libwebp=get_text("backend_yes") if backends.libwebp_available() else get_text("backend_no"),
+                         jpegtran=get_text("backend_yes") if backends.jpegtran_available() else get_text("backend_no"),
+                         mozjpeg=get_text("backend_yes") if backends.mozjpeg_available() else get_text("backend_no"),
+                         oxipng=get_text("backend_yes") if backends.oxipng_available() else get_text("backend_no"),
+                         pngquant=get_text("backend_yes") if backends.pngquant_available() else get_text("backend_no")))
 
     # 初始化统计变量
     total_processed_in_session = 0
@@ -217,122 +399,79 @@ def main_runner(root_folder):
     total_original_size_bytes = 0
     total_output_size_bytes = 0
     processed_dirs_count = 0
-    manager = None
-
-    # --- 注册 set 和 lock 类型并启动 Manager ---
-    try:
-        # 确保在使用 BaseManager 前初始化 multiprocessing 上下文（尤其是在 macOS 或 Windows 上）
-        # multiprocessing.set_start_method('fork') # 或者 'spawn', 'forkserver' 根据需要和平台
-        # 注意：set_start_method 只能调用一次，通常在 if __name__ == "__main__": 块的开始处
-
-        set_methods = ('__contains__', '__iter__', 'add', 'update', '__len__', 'remove', 'discard', 'clear', 'pop', 'issubset', 'issuperset', 'union', 'intersection', 'difference')
-        # 确保这些类型在使用前注册
-        if not hasattr(BaseManager, 'SharedSet'):
-             BaseManager.register('SharedSet', set, exposed=set_methods)
-        if not hasattr(BaseManager, 'Lock'):
-             BaseManager.register('Lock', multiprocessing.Lock)
-
-        manager = BaseManager()
-        manager.start()
-        logger.info(get_text("manager_start_success"))
-    except Exception as manager_err:
-        logger.critical(get_text("manager_start_fail", error=manager_err), exc_info=True)
-        sys.exit(1)
-
-    dir_states = {} # 存储每个目录的状态 { 'processed_set': SharedSetProxy, 'lock': LockProxy }
 
     # --- 收集任务 ---
-    tasks_by_dir = defaultdict(list)
+    # 扫描时直接构建待提交的任务列表 (每个文件一个 dict，处理结果时原样使用)，并统计每个目录的任务数
+    tasks_to_submit = []
+    remaining_by_dir = {} # 目录全部完成时写入其状态缓冲
     logger.info(get_text("task_collect_scan"))
+    # 目录日志文件名模板和模式特定参数在整个运行中不变，经进程池的 initializer 每个工作进程只传递一次
+    if mode == 'webp':
+        common_task_args = (dir_log_file_name, user_params['webp_quality'], user_params['webp_lossless'])
+    else:
+        common_task_args = (dir_log_file_name, user_params['quality'], user_params['png_optimize'])
+    skip_processed_key = "convert_skip_processed" if mode == 'webp' else "compress_skip_processed"
     try:
-        for subdir, _, files in os.walk(root_folder_norm):
-            subdir_norm = os.path.normpath(subdir)
-
-            # 过滤出支持的图片文件
-            image_files_in_dir = [f for f in files if os.path.splitext(f)[1].lower() in config.SUPPORTED_EXTENSIONS]
+        # 各目录的状态文件在扫描线程中读取，与其余目录的扫描重叠
+        def load_dir_state(dir_path):
+            return state.load_processed_files_from_dir(logger, os.path.join(dir_path, dir_state_file_name))
+
+        for subdir_norm, entries, initial_processed_set in _iter_dir_entries(root_folder_norm, config.SCAN_IGNORE_DIRS,
+                                                                             threads=config.SCAN_THREADS, stat_filter=_image_ext,
+                                                                             dir_loader=load_dir_state):
+            # 根目录已规范化，子目录和文件路径都是在其后逐级拼接条目名得到的，无需再 normpath
+
+            # 过滤出支持的图片文件，扩展名只计算一次
+            image_files_in_dir = []
+            for entry in entries:
+                ext = _image_ext(entry.name)
+                if ext is not None:
+                    image_files_in_dir.append((entry, ext))
             if not image_files_in_dir:
                 continue # 没有图片文件，跳过此目录
 
-            # 为该目录加载或创建状态
-            if subdir_norm not in dir_states:
-                dir_state_file_path = os.path.join(subdir_norm, dir_state_file_name)
-                initial_processed_set = state.load_processed_files_from_dir(logger, dir_state_file_path)
-                # 使用 manager 创建共享对象
-                try:
-                    shared_set = manager.SharedSet(initial_processed_set)
-                    shared_lock = manager.Lock()
-                    dir_states[subdir_norm] = {
-                        'processed_set': shared_set,
-                        'lock': shared_lock
-                    }
-                    # 使用 get_text 记录加载的条目数
-                    logger.debug(get_text("dir_processed_count", subdir=subdir_norm, state_file=dir_state_file_name, count=len(initial_processed_set)))
-                except Exception as manager_create_err:
-                     logger.error(f"Failed to create shared objects for directory {subdir_norm}: {manager_create_err}")
-                     continue # 跳过此目录的处理
-
-            current_dir_state = dir_states[subdir_norm]
-            processed_set_proxy = current_dir_state['processed_set']
-            lock_proxy = current_dir_state['lock']
             dir_state_file_path = os.path.join(subdir_norm, dir_state_file_name) # 状态文件路径
+            # 已处理的文件在提交前过滤掉，工作进程无需访问状态文件
+            logger.debug(get_text("dir_processed_count", subdir=subdir_norm, state_file=dir_state_file_name, count=len(initial_processed_set)))
+            webp_conflicts = _webp_target_conflicts(entries, image_files_in_dir, initial_processed_set) if mode == 'webp' else ()
 
             # 遍历目录中的图片文件，创建任务
-            for filename in image_files_in_dir:
-                # 跳过临时文件、状态文件和日志文件
-                is_temp_or_meta = False
-                if filename.endswith((".compress_temp", ".webp_temp")):
-                     is_temp_or_meta = True
-                elif filename == dir_state_file_name or filename == dir_log_file_name:
-                     is_temp_or_meta = True
-                # 跳过其他模式的日志/状态文件
-                elif mode == 'webp' and (filename == config.INPLACE_DIR_LOG_FILE_NAME or filename == config.INPLACE_DIR_STATE_FILE_NAME):
-                     is_temp_or_meta = True
-                elif mode == 'inplace' and (filename == config.WEBP_DIR_LOG_FILE_NAME or filename == config.WEBP_DIR_STATE_FILE_NAME):
-                     is_temp_or_meta = True
-
-                if is_temp_or_meta:
-                    continue
-
+            for entry, ext in image_files_in_dir:
                 # WebP 模式下跳过 .webp 文件本身
-                if mode == 'webp' and os.path.splitext(filename)[1].lower() == '.webp':
-                    # 可以选择记录跳过日志
-                    # logger.debug(get_text("skip_webp_self", path=os.path.join(subdir_norm, filename)))
+                if mode == 'webp' and ext == '.webp':
+                    continue
+                if entry.name in initial_processed_set:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(get_text(skip_processed_key, state_file=dir_state_file_name, path=entry.path))
+                    total_skipped_in_session += 1
+                    continue
+                if entry.name in webp_conflicts:
+                    logger.error(get_text("convert_target_conflict", path=entry.path,
+                                          webp_filename=os.path.splitext(entry.name)[0] + ".webp"))
+                    total_errors_in_session += 1
                     continue
 
-                file_path_norm = os.path.normpath(os.path.join(subdir_norm, filename))
+                file_path_norm = entry.path # os.scandir 已拼接好完整路径
 
-                # 确保是文件而不是目录（尽管 os.walk 通常只返回文件）
-                if not os.path.isfile(file_path_norm):
+                # 确保是普通文件 (符号链接按目标判断)；同一次 stat 顺便取得文件大小用于排序
+                try:
+                    file_stat = entry.stat()
+                except OSError:
+                    file_stat = None
+                if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
                     logger.warning(get_text("task_collect_skip_not_file", path=file_path_norm))
                     continue
 
-                # 构建任务参数列表
-                task_args = [
-                    file_path_norm,
-                    processed_set_proxy, # 传递共享集合代理
-                    dir_state_file_path, # 传递状态文件路径
-                    dir_log_file_name,   # 传递目录日志文件名模板
-                ]
-                # 根据模式添加特定参数
-                if mode == 'webp':
-                    task_args.extend([user_params['webp_quality'], user_params['webp_lossless'], lock_proxy]) # 传递锁代理
-                elif mode == 'inplace':
-                    task_args.extend([user_params['quality'], user_params['png_optimize'], lock_proxy]) # 传递锁代理
-
-                # 将任务添加到字典中
-                tasks_by_dir[subdir_norm].append({'func': process_func_ref, 'args': task_args})
+                # 排序键：同一格式的文件连续处理，格式内先提交大文件，使各工作进程的负载更均衡
+                sort_key = (ext, -file_stat.st_size)
+                tasks_to_submit.append({'file_path': file_path_norm, 'dir': subdir_norm, 'state_file': dir_state_file_path, 'sort_key': sort_key})
+                remaining_by_dir[subdir_norm] = remaining_by_dir.get(subdir_norm, 0) + 1
 
     except Exception as e:
         logger.critical(get_text("task_collect_error", error=e), exc_info=True)
-        if manager: manager.shutdown()
         sys.exit(1)
 
-    # 将所有任务收集到一个列表中以便提交
-    tasks_to_submit = []
-    for subdir, tasks in tasks_by_dir.items():
-        for task in tasks:
-            # 添加目录信息，方便后续处理结果
-            tasks_to_submit.append({'task': task, 'dir': subdir})
+    tasks_to_submit.sort(key=lambda task_info: task_info['sort_key'])
 
     total_tasks = len(tasks_to_submit)
     if total_tasks == 0:
@@ -341,115 +480,151 @@ def main_runner(root_folder):
          duration = end_time - start_time
          logger.info(get_text("task_end", mode_name=mode_name))
          logger.info(get_text("summary_processed", count=0))
-         logger.info(get_text("summary_skipped", count=0))
+         logger.info(get_text("summary_skipped", count=total_skipped_in_session))
          logger.info(get_text("summary_dirs_processed", count=0))
-         logger.info(get_text("summary_errors", count=0))
+         logger.info(get_text("summary_errors", count=total_errors_in_session))
          logger.info(get_text("summary_size_before", size=0.0))
          logger.info(get_text("summary_size_after", size=0.0))
          logger.info(get_text("summary_duration", duration=duration))
          global_log_path_for_summary = os.path.join(config.RUN_STATE_DIR, os.path.basename(config.GLOBAL_LOG_FILE_PATH))
          logger.info(get_text("summary_global_log", path=global_log_path_for_summary))
-         if manager: manager.shutdown()
          sys.exit(0)
 
-    logger.info(get_text("task_collect_success", count=total_tasks, dirs=len(tasks_by_dir)))
+    logger.info(get_text("task_collect_success", count=total_tasks, dirs=len(remaining_by_dir)))
 
     # --- 并发执行任务 ---
     processed_count_in_loop = 0
-    futures_map = {} # 存储 future 到任务信息的映射
+    futures_map = {} # 存储 future 到批次内任务信息列表的映射
     processed_dirs_set = set() # 记录实际处理过的目录
+    tracebacks_logged = 0 # 已记录回溯的批次异常数
+    last_traceback_error = None
+
+    # 工作进程的日志消息经队列交给后台线程处理 (目录日志也在该线程中写入)
+    log_queue = multiprocessing.Queue()
+    log_listener = WorkerLogListener(log_queue, logger, get_text, dir_log_file_name)
+    log_listener.start()
 
     try:
         # 使用从 UI 获取的 num_workers
-        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=core.init_worker, initargs=(log_queue, common_task_args)) as executor:
             logger.info(get_text("submitting_tasks", count=total_tasks))
-            for i, task_info in enumerate(tasks_to_submit):
-                task = task_info['task']
-                # 提交任务到进程池
-                future = executor.submit(task['func'], *task['args'])
-                # 存储 future 和相关信息，用于后续结果处理
-                futures_map[future] = {'index': i, 'dir': task_info['dir'], 'file_path': task['args'][0]} # args[0] is file_path
+            # 按排序后的顺序切分成批次，每批在一个工作进程内流水线处理，摊薄进程间通信开销；
+            # 任务较少时缩小批次，保证每个工作进程至少能分到几个批次，负载仍然均衡
+            batch_size = max(1, min(config.TASK_BATCH_SIZE, total_tasks // (num_workers * 4)))
+            for batch_start in range(0, total_tasks, batch_size):
+                batch = tasks_to_submit[batch_start:batch_start + batch_size]
+                # 每个任务只传文件路径，共用参数 (common_task_args) 由工作进程追加在后面
+                future = executor.submit(core.process_batch, process_func_ref, [[task_info['file_path']] for task_info in batch])
+                # 存储 future 和批次内每个任务的信息，用于后续结果处理
+                futures_map[future] = batch
 
             logger.info(get_text("tasks_submitted"))
 
-            # 处理已完成的任务
-            for future in as_completed(futures_map):
-                processed_count_in_loop += 1
-                task_info = futures_map[future]
-                file_path = task_info['file_path']
-                dir_path = task_info['dir']
-
-                # 定期打印进度
-                if processed_count_in_loop % 50 == 0 or processed_count_in_loop == total_tasks:
-                    logger.info(get_text("progress_update", done=processed_count_in_loop, total=total_tasks))
-
-                try:
-                    # 获取任务结果，设置超时（例如 5 分钟）
-                    result = future.result(timeout=300) # 300 秒超时
-
-                    # 处理子进程返回的日志消息
-                    if result.get('log_messages'):
-                        log_processor_messages(logger, get_text, dir_log_file_name, result['log_messages'])
-
-                    # 根据结果更新统计数据
-                    status = result.get('status', 'error')
-                    original_size = result.get('original_size')
-                    output_size = result.get('output_size')
-
-                    # 累加原始大小（仅在非跳过时估算）
-                    if original_size is not None and status != 'skipped':
-                        total_original_size_bytes += original_size
-
-                    if status == 'success':
-                        total_processed_in_session += 1
-                        processed_dirs_set.add(dir_path) # 记录处理过的目录
-                        if output_size is not None:
-                            total_output_size_bytes += output_size
+            # 处理已完成的批次
+            collected_futures = set() # 结果已在下面的循环中处理完的批次
+            try:
+                for future in as_completed(futures_map):
+                    batch_infos = futures_map[future]
+                    batch_error = None
+                    try:
+                        # as_completed 只返回已完成的 future，这里不会等待
+                        batch_results = future.result()
+                    except Exception as exc:
+                        batch_error = exc
+                        batch_results = [None] * len(batch_infos)
+
+                    for task_info, result in zip(batch_infos, batch_results):
+                        processed_count_in_loop += 1
+                        file_path = task_info['file_path']
+                        dir_path = task_info['dir']
+
+                        # 定期打印进度
+                        if processed_count_in_loop % 50 == 0 or processed_count_in_loop == total_tasks:
+                            logger.info(get_text("progress_update", done=processed_count_in_loop, total=total_tasks))
+
+                        if batch_error is not None:
+                            # 获取结果时发生其他异常。同一批次的任务共享同一个异常，回溯只随批次的第一个任务记录一次，
+                            # 且整个运行最多记录 config.MAX_LOGGED_TRACEBACKS 次，大量失败时不必反复格式化相同的回溯
+                            log_traceback = batch_error is not last_traceback_error and tracebacks_logged < config.MAX_LOGGED_TRACEBACKS
+                            if log_traceback:
+                                last_traceback_error = batch_error
+                                tracebacks_logged += 1
+                            logger.critical(get_text("task_result_error", path=file_path, error=batch_error), exc_info=batch_error if log_traceback else None)
+                            total_errors_in_session += 1
+                            processed_dirs_set.add(dir_path) # 异常也算处理过此目录
                         else:
-                             # 理论上成功应该有输出大小，记录警告
-                             logger.warning(f"Successful task for {file_path} returned None output_size.")
-                    elif status == 'skipped':
-                        total_skipped_in_session += 1
-                        # 跳过的文件理论上不应有 output_size，如果 core 返回了，记录警告
-                        if output_size is not None:
-                            logger.warning(f"Skipped file {file_path} but received output size {output_size}. Ignoring size.")
-                    else: # status == 'error' or 未知状态
-                        total_errors_in_session += 1
-                        processed_dirs_set.add(dir_path) # 出错也算处理过此目录
-                        # 错误情况下，如果 core 返回了 output_size (例如重命名失败前的大小)，也累加
-                        if output_size is not None:
-                             total_output_size_bytes += output_size
-                        error_details = result.get('error_details', 'Unknown error from worker')
-                        # 使用 get_text 记录失败信息
-                        logger.error(get_text("task_failed", path=file_path, details=error_details))
-
-                except TimeoutError:
-                     logger.error(get_text("task_timeout", timeout=300, path=file_path))
-                     total_errors_in_session += 1
-                     processed_dirs_set.add(dir_path) # 超时也算处理过此目录
-                except Exception as exc:
-                    # 获取结果时发生其他异常
-                    logger.critical(get_text("task_result_error", path=file_path, error=exc), exc_info=True)
-                    total_errors_in_session += 1
-                    processed_dirs_set.add(dir_path) # 异常也算处理过此目录
+                            # 处理子进程返回的日志消息
+                            if result.log_messages:
+                                log_processor_messages(logger, get_text, dir_log_file_name, result.log_messages)
+
+                            # 根据结果更新统计数据
+                            status = result.status
+                            original_size = result.original_size
+                            output_size = result.output_size
+
+                            # 累加原始大小（仅在非跳过时估算）
+                            if original_size is not None and status != 'skipped':
+                                total_original_size_bytes += original_size
+
+                            if status == 'success':
+                                total_processed_in_session += 1
+                                processed_dirs_set.add(dir_path) # 记录处理过的目录
+                                # 主进程是状态文件的唯一写入者，子进程之间无需加锁
+                                state.save_processed_file_to_dir(logger, task_info['state_file'], result.original_filename)
+                                if output_size is not None:
+                                    total_output_size_bytes += output_size
+                                else:
+                                     # 理论上成功应该有输出大小，记录警告
+                                     logger.warning(f"Successful task for {file_path} returned None output_size.")
+                            elif status == 'skipped':
+                                total_skipped_in_session += 1
+                                # 跳过的文件理论上不应有 output_size，如果 core 返回了，记录警告
+                                if output_size is not None:
+                                    logger.warning(f"Skipped file {file_path} but received output size {output_size}. Ignoring size.")
+                            else: # status == 'error' or 未知状态
+                                total_errors_in_session += 1
+                                processed_dirs_set.add(dir_path) # 出错也算处理过此目录
+                                # 错误情况下，如果 core 返回了 output_size (例如重命名失败前的大小)，也累加
+                                if output_size is not None:
+                                     total_output_size_bytes += output_size
+                                error_details = result.error_details or 'Unknown error from worker'
+                                # 使用 get_text 记录失败信息
+                                logger.error(get_text("task_failed", path=file_path, details=error_details))
+
+                        remaining_by_dir[dir_path] -= 1
+                        if remaining_by_dir[dir_path] == 0:
+                            state.flush_processed(logger, task_info['state_file'])
+                    collected_futures.add(future)
+            except BaseException:
+                # 中断 (Ctrl+C、SIGTERM) 时取消尚未开始的批次，只等待正在处理的批次，而不是剩余的全部任务
+                for pending_future in futures_map:
+                    pending_future.cancel()
+                executor.shutdown(wait=True)
+                # 这些批次中成功的文件已被替换，仍然记入状态文件，下次运行不再重复处理
+                for done_future, batch_infos in futures_map.items():
+                    if done_future in collected_futures or done_future.cancelled() or done_future.exception() is not None:
+                        continue
+                    for task_info, result in zip(batch_infos, done_future.result()):
+                        if result.status == 'success':
+                            state.save_processed_file_to_dir(logger, task_info['state_file'], result.original_filename)
+                raise
 
 
     except KeyboardInterrupt:
         logger.warning(get_text("user_interrupt_process"))
         # 使用 get_text 打印中断信息
         print(f"\n{get_text('user_interrupt_process')} - Shutting down process pool...")
-        # executor 会在 with 块结束时自动 shutdown，但 manager 需要手动关闭
+        # executor 会在 with 块结束时自动 shutdown
     except Exception as e:
         # 捕获 ProcessPoolExecutor 启动或运行中的其他意外错误
         logger.critical(get_text("unexpected_error_process") + f": {e}", exc_info=True)
         print(f"\n{get_text('unexpected_error_process')}: {e}")
     finally:
-         if manager:
-             logger.debug("Shutting down multiprocessing manager...")
-             try:
-                 manager.shutdown()
-             except Exception as manager_shutdown_err:
-                  logger.error(get_text("manager_shutdown_error", error=manager_shutdown_err))
+         # 工作进程已全部退出，它们放入队列的日志都在哨兵之前；处理完剩余日志后再输出汇总
+         log_listener.stop()
+         log_utils.flush_directory_logs(logger)
+         # 写入中断或出错时仍在缓冲中的状态记录
+         state.flush_processed(logger)
 
 
     # --- 任务结束统计 ---
@@ -531,9 +706,14 @@ if __name__ == "__main__":
 
     if not os.path.isdir(args.root_folder):
         # 使用 get_text 打印路径错误
-        print(get_text("error_invalid_path", path=args.root_folder), file=sys.stderr)
+        print(utils.get_text("error_invalid_path", path=args.root_folder), file=sys.stderr)
         sys.exit(1)
 
+    # 默认的 SIGTERM 处理会直接结束进程，缓冲中的记录来不及写入
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+    _import_processing_modules()
+
     # --- 执行主函数 ---
     # 不再传递 args.workers
     main_runner(root_folder=args.root_folder)
\ No newline at end of file